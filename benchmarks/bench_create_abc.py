@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+#    Benchmark of 'create_abc()' (strings for the alphabetic sort).
+#
+#    The keys computed by the present 'create_abc()' are compared to the
+#    ones computed by the implementation of version v.0.6-py3 (a copy of
+#    which is kept below as 'legacy_create_abc()'), on a synthetic set of
+#    bibliography entries.
+#
+#    Usage:
+#        $ python benchmarks/bench_create_abc.py [-n 10000] [-r 3]
+
+import os
+import re
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pysortex3
+
+
+def legacy_create_abc(bibitem):
+
+    abc = re.sub(r'\s*\\bibitem\s*{((?!#).+?)}\s*', '', bibitem)
+    abc = re.sub(r'\xef\xac\x80', r'ff', abc)
+    abc = re.sub(r'\xef\xac\x81', r'fi', abc)
+    abc = re.sub(r'\xef\xac\x82', r'fl', abc)
+    abc = re.sub(r'\xef\xac\x83', r'ffi', abc)
+    abc = re.sub(r'\xef\xac\x84', r'ffl', abc)
+    abc = re.sub(r'\xef\xac\x85', r'st', abc)
+    abc = re.sub(r'\xef\xac\x86', r'st', abc)
+    abc = re.sub(r'\xe2\x80\x90', r'-', abc)
+    abc = re.sub(r'\xe2\x80\x91', r'-', abc)
+    abc = re.sub(r'\xe2\x80\x92', r'-', abc)
+    abc = re.sub(r'\xe2\x80\x93', r'-', abc)
+    abc = re.sub(r'\xe2\x80\x94', r'-', abc)
+    abc = re.sub(r'\xe2\x80\x95', r'-', abc)
+    abc = re.sub(r'ä', r'a', abc)
+    abc = re.sub(r'ë', r'e', abc)
+    abc = re.sub(r'ï', r'i', abc)
+    abc = re.sub(r'ö', r'o', abc)
+    abc = re.sub(r'ü', r'u', abc)
+    abc = re.sub(r'\\"\s*([aeiouAEIOU])', r'\1', abc)
+    abc = re.sub(r'\\"\s*{\s*([aeiouAEIOU])\s*}', r'\1', abc)
+    abc = re.sub(r'ß', r'ss', abc)
+    abc = re.sub(r'\\&', r',', abc)
+    abc = re.sub(r'–', r'-', abc)
+    abc = re.sub(r"\\'|'", r'', abc)
+    abc = re.sub(r"\\~|~", r'', abc)
+    abc = re.sub(r"\\´|´", r'', abc)
+    abc = re.sub(r"\\`|`", r'', abc)
+    abc = re.sub(r"°", r'', abc)
+    abc = re.sub(r"\s\\\s", r'', abc)
+    abc = re.sub(r'\\emph', r'', abc)
+    abc = re.sub(r'\\textit', r'', abc)
+    abc = re.sub(r'\\bold', r'', abc)
+    abc = re.sub(r'\\normalsize', r'', abc)
+    abc = re.sub(r'\\[a-z]+{', r'{', abc)
+    abc = re.sub(r'\sand\s', r', ', abc)
+    abc = re.sub(r'\s\(Ed.\)', r',', abc)
+    abc = re.sub(r'\s\(Eds.\)', r',', abc)
+    abc = re.sub(r'{|}', r'', abc)
+    abc = re.sub(r'-?([A-Z][a-z]?)\.\s*', r'', abc)
+    abc = re.sub(r'\s-?[A-Z],', r'', abc)
+    abc = re.sub(r',\s*,', r',', abc)
+    abc = re.sub(r'-\s*-', r'-', abc)
+    abc = re.sub(r'\s', r'', abc)
+    return abc.lower()
+
+
+SURNAMES = ['M\\"uller', 'M\\"{u}ller', 'Müller', 'Jürgens', 'Strauß', "O'Neil",
+            "{\\'E}cole", 'G\\`odel', 'Nu\\~nez', 'de la Cruz', 'Smith', 'Brown',
+            'Zhang', 'Öztürk', 'Ångström', 'Sá', 'Bj{\\o}rk', 'Smith-Jones']
+TITLES = ['On the theory of {PDE}s', '\\emph{Waves} in solids',
+          'Shock structure \\& relaxation', '\\textit{Kinetic} models',
+          '{\\bf Numerical} methods -- a review', 'Lectures at 20° C']
+
+
+def make_entries(n, seed=0):
+    """
+    returns a list of 'n' synthetic entries of 'thebibliography' environment.
+    """
+
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(n):
+        authors = ['{}.~{}'.format(rnd.choice('ABCDEFGH'), rnd.choice(SURNAMES))
+                   for _ in range(rnd.randint(1, 4))]
+        entry = '\\bibitem{{key{}}}\n{}, {}{}, {}, {}.\n\n'.format(
+            i, ', '.join(authors[:-1]) + (' and ' if len(authors) > 1 else '') + authors[-1],
+            '(Eds.) ' if rnd.random() < 0.1 else '', rnd.choice(TITLES),
+            'J. Appl. Math. {}'.format(rnd.randint(1, 99)), rnd.randint(1950, 2024))
+        entries.append(entry)
+    return entries
+
+
+def best_time(func, entries, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        keys = [func(entry) for entry in entries]
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, keys
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=10000, help="number of entries [default 10000]")
+    parser.add_argument('-r', type=int, default=3, help="number of repetitions [default 3]")
+    args = parser.parse_args()
+
+    entries = make_entries(args.n)
+
+    t_legacy, keys_legacy = best_time(legacy_create_abc, entries, args.r)
+    t_new, keys_new = best_time(pysortex3.create_abc, entries, args.r)
+
+    ndiff = sum(1 for a, b in zip(keys_legacy, keys_new) if a != b)
+
+    print(f"entries:            {args.n}")
+    print(f"legacy create_abc:  {t_legacy:.3f} s")
+    print(f"create_abc:         {t_new:.3f} s  ({t_legacy/t_new:.1f}x)")
+    print(f"different keys:     {ndiff}")
+
+    sys.exit(1 if ndiff else 0)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+#    Benchmark of the stages of 'bibsort()' on a synthetic document.
+#
+#    For each stage the best wall time over the repetitions and the peak of
+#    the memory allocated (as traced by 'tracemalloc', in a separate run)
+#    are reported. The document is generated by 'corpus.py' in a temporary
+#    directory, unless an existing root file is given with -i.
+#
+#    Usage:
+#        $ python benchmarks/bench_stages.py [--files 50] [--cites 5000]
+#              [--bibitems 2000] [--multi 0.3] [--ascii] [-r 3]
+#        $ python benchmarks/bench_stages.py -i path/to/main.tex
+
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import pysortex3
+from corpus import make_corpus
+
+
+def run_stages(filename, dirname, flag_sort):
+    """
+    runs the stages of 'bibsort()' (without writing the output) and yields
+    the name of each stage after it has been completed.
+    """
+
+    state = {}
+
+    state['doc'] = pysortex3.parse_document(filename, dirname)
+    yield 'recursive_parser'
+
+    # the citations are found while parsing the files, and only collected here
+    state['cites'] = pysortex3.collect_cites(state['doc']['cites'])
+    yield 'collect_cites'
+
+    state['bibitems'] = pysortex3.parse_bibitems(state['doc']['text'])
+    yield 'parse_bibitems'
+
+    for value in state['bibitems'].values():
+        value.abc = pysortex3.create_abc(value.item)
+    yield 'create_abc'
+
+    pysortex3.make_new_bib(state['cites'], state['bibitems'], flag_sort, False)
+    yield f'make_new_bib ({flag_sort})'
+
+
+def time_stages(filename, dirname, flag_sort, repeat):
+    # best wall time of each stage
+    times = {}
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for stage in run_stages(filename, dirname, flag_sort):
+            t1 = time.perf_counter()
+            times[stage] = min(times.get(stage, t1-t0), t1-t0)
+            t0 = time.perf_counter()
+    return times
+
+
+def trace_stages(filename, dirname, flag_sort):
+    # peak of the memory allocated during each stage
+    peaks = {}
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    for stage in run_stages(filename, dirname, flag_sort):
+        current, peak = tracemalloc.get_traced_memory()
+        peaks[stage] = peak
+        tracemalloc.reset_peak()
+    tracemalloc.stop()
+    return peaks
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i', '--inputfile', help="root file of an existing document")
+    parser.add_argument('--files', type=int, default=50, help="number of included files [default 50]")
+    parser.add_argument('--cites', type=int, default=5000, help="number of \\cite{} [default 5000]")
+    parser.add_argument('--bibitems', type=int, default=2000, help="number of \\bibitem{} [default 2000]")
+    parser.add_argument('--multi', type=float, default=0.3, help="fraction of multiple citations [default 0.3]")
+    parser.add_argument('--ascii', action='store_true', help="no non-ASCII authors")
+    parser.add_argument('-s', '--sort', default='alphabetic', help="type of sorting: 'call' or 'alphabetic' [default]")
+    parser.add_argument('-r', type=int, default=3, help="number of repetitions [default 3]")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        if args.inputfile is not None:
+            dirname, filename = os.path.split(os.path.abspath(args.inputfile))
+        else:
+            dirname = tmpdir
+            filename = make_corpus(dirname, args.files, args.cites, args.bibitems, 
+                                   args.multi, not args.ascii)
+
+        size = sum(os.path.getsize(os.path.join(dirname, f)) for f in os.listdir(dirname) 
+                   if f.endswith('.tex'))
+
+        times = time_stages(filename, dirname, args.sort, args.r)
+        peaks = trace_stages(filename, dirname, args.sort)
+
+    print(f"document: {size/2**20:.2f} MB of .tex files")
+    print(f"{'stage':<28}{'time [s]':>12}{'peak [MB]':>12}")
+    for stage in times:
+        print(f"{stage:<28}{times[stage]:>12.4f}{peaks[stage]/2**20:>12.2f}")
+    print(f"{'total':<28}{sum(times.values()):>12.4f}")
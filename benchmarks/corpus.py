@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+#    Generator of synthetic LaTeX documents for the benchmarks.
+#
+#    The document is made of a root file including 'nfiles' chapters (some
+#    of which include a further section file), with 'ncites' occurrences of
+#    '\cite{}' spread over the chapters and a file with 'thebibliography'
+#    environment holding 'nbibitems' entries (in random order).
+#
+#    Usage:
+#        $ python benchmarks/corpus.py DIRNAME [--files 50] [--cites 5000]
+#              [--bibitems 2000] [--multi 0.3] [--ascii] [--seed 0]
+
+import os
+import random
+
+from bench_create_abc import make_entries
+
+
+def make_corpus(dirname, nfiles=50, ncites=5000, nbibitems=2000, multi=0.3, 
+                flag_unicode=True, seed=0):
+    """
+    writes a synthetic document in 'dirname' and returns the name of its
+    root file.
+
+    Arguments:
+       nfiles
+           number of chapter files included by the root file (one out of
+           three chapters includes also a section file)
+       ncites
+           total number of occurrences of '\\cite{}'
+       nbibitems
+           number of entries of the bibliography
+       multi
+           fraction of '\\cite{}' with more than one key (e.g. '\\cite{a,b,c}')
+       flag_unicode
+           whether the entries contain non-ASCII authors (otherwise only
+           LaTeX accents are used)
+    """
+
+    rnd = random.Random(seed)
+    os.makedirs(dirname, exist_ok=True)
+
+    keys = [f'key{i}' for i in range(nbibitems)]
+    nfiles = max(nfiles, 1)
+
+    root = ['\\documentclass{article}\n', '\\begin{document}\n']
+
+    for f in range(nfiles):
+
+        root.append(f'\\input{{chapter{f}}}\n')
+
+        lines = [f'\\section{{Chapter {f}}}\n']
+        for c in range(ncites // nfiles + (f < ncites % nfiles)):
+            if rnd.random() < multi:
+                cited = ', '.join(rnd.sample(keys, min(rnd.randint(2, 4), len(keys))))
+            else:
+                cited = rnd.choice(keys)
+            lines.append(f'Some text with a citation \\cite{{{cited}}}. % note {c}\n')
+
+        if f % 3 == 0:
+            lines.append(f'\\include{{chapter{f}sec}}\n')
+            with open(os.path.join(dirname, f'chapter{f}sec.tex'), 'w') as fout:
+                fout.write('A section without citations.\n' * 20)
+
+        with open(os.path.join(dirname, f'chapter{f}.tex'), 'w') as fout:
+            fout.write(''.join(lines))
+
+    root.append('\\input{biblio}\n')
+    root.append('\\end{document}\n')
+
+    with open(os.path.join(dirname, 'main.tex'), 'w') as fout:
+        fout.write(''.join(root))
+
+    entries = make_entries(nbibitems, seed)
+    if not flag_unicode:
+        entries = [e.encode('ascii', 'ignore').decode('ascii') for e in entries]
+    rnd.shuffle(entries)
+
+    with open(os.path.join(dirname, 'biblio.tex'), 'w') as fout:
+        fout.write('\\begin{thebibliography}{99}\n\n')
+        fout.write(''.join(entries))
+        fout.write('\\end{thebibliography}\n')
+
+    return 'main.tex'
+
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('dirname', help="directory where the document is written")
+    parser.add_argument('--files', type=int, default=50, help="number of included files [default 50]")
+    parser.add_argument('--cites', type=int, default=5000, help="number of \\cite{} [default 5000]")
+    parser.add_argument('--bibitems', type=int, default=2000, help="number of \\bibitem{} [default 2000]")
+    parser.add_argument('--multi', type=float, default=0.3, help="fraction of multiple citations [default 0.3]")
+    parser.add_argument('--ascii', action='store_true', help="no non-ASCII authors")
+    parser.add_argument('--seed', type=int, default=0, help="random seed [default 0]")
+    args = parser.parse_args()
+
+    filename = make_corpus(args.dirname, args.files, args.cites, args.bibitems, 
+                           args.multi, not args.ascii, args.seed)
+
+    print(os.path.join(args.dirname, filename))
@@ -368,18 +368,17 @@ def make_new_bib(cites, bibitems, flag_sort, flag_verbose=True):
 
     print SS+"processing sorted bibliography ({} order)".format(str_sort)
 
-    thebibliography = ''
+    thebibliography = [] # fragments of the new bibliography, joined at the end
     i = 0
 
     if flag_sort_by_call:
         
-        bb_keys = bibitems.keys()
         i_nokey, i_nocite = 0, 0
 
         for key in cites:
 
-            if key in bb_keys:
-                thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
+            if key in bibitems:
+                thebibliography.append(bibitems[key][1])
                 i += 1
                 bibitems[key][2] = i
             else:
@@ -396,7 +395,7 @@ def make_new_bib(cites, bibitems, flag_sort, flag_verbose=True):
                     if flag_verbose:
                         print SS+"WARNING: bibitem '{}' (position #{}) is not cited in the text (moved at the bottom)".format(item[0], item[1][0])
                     key = item[0]
-                    thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
+                    thebibliography.append(bibitems[key][1])
                     i_nocite += 1
                     i += 1
 
@@ -416,13 +415,13 @@ def make_new_bib(cites, bibitems, flag_sort, flag_verbose=True):
         sorted_bibitems = sorted(bibitems.items(), key=lambda abc: abc[1][3])
         
         for key, value in sorted_bibitems:
-            thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
+            thebibliography.append(bibitems[key][1])
             i += 1
             bibitems[key][2] = i
             
             print "{}: {}".format(i, bibitems[key][3])
 
-    return thebibliography
+    return ''.join(thebibliography)
 
 
 
@@ -37,489 +37,3438 @@ version = 'v.0.6-py3'
 
 import sys
 import os
+import posixpath
 import re
-import operator
+import unicodedata
+import mmap
+import shutil
+import locale
+import tempfile
+import json
+import hashlib
+import time
+import concurrent.futures
+import glob
+import contextlib
+import threading
+import logging
+import contextvars
+import collections
+import itertools
+import asyncio
+import functools
+import gzip
+import difflib
+
+try:
+    import fcntl
+except ImportError: # e.g. on Windows, where only the threads of a process are serialized
+    fcntl = None
 
 S  = "..."
 SS = S*2 
 
+# stages measured by 'new_stats()' and '_timed()'
+STAGES = ('include_expansion', 'comment_stripping', 'cite_parsing', 'bibitem_parsing', 
+          'key_normalization', 'assembly', 'write', 'total')
 
-def recursive_parser(filename, dirname=None, flag_stripcomments=True, _firstcall=True, _filecount=1, _filename_bib=''):
+_stats_lock = threading.Lock()
+
+# the messages of the library functions go to this logger (which is silent,
+# unless a handler is configured, as done by the command line interface) or
+# to the collector set by 'sort_bibliography()'
+logger = logging.getLogger('pysortex')
+logger.addHandler(logging.NullHandler())
+
+_collector = contextvars.ContextVar('pysortex_collector', default=None)
+
+
+def _log(level, message):
+    # sends 'message' to the active collector, if any, else to the logger
+    collector = _collector.get()
+    if collector is not None:
+        collector(level, message)
+    else:
+        logger.log(level, message)
+
+
+def _info(message):
+    _log(logging.INFO, message)
+
+
+def _warning(message):
+    _log(logging.WARNING, message)
+
+
+def _error(message):
+    _log(logging.ERROR, message)
+
+
+def new_stats():
+    """
+    returns a dictionary to collect the statistics of 'bibsort()': for each
+    stage of STAGES it holds a dictionary with the wall time in seconds
+    ('time'), the number of characters processed ('chars') and the number
+    of times the stage has been run ('count').
+
+    Note that 'include_expansion' is the whole reading of the document, so
+    that it includes 'comment_stripping' and the scanning of each file for
+    '\\cite{}' (which is counted also in 'cite_parsing').
+    """
+
+    return {stage: {'time': 0.0, 'chars': 0, 'count': 0} for stage in STAGES}
+
+
+
+@contextlib.contextmanager
+def _timed(stats, stage, nchars=0):
+    # adds to 'stats' (if not None) the time spent in the 'with' block
+    if stats is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        t = time.perf_counter() - t0
+        with _stats_lock:
+            stats[stage]['time'] += t
+            stats[stage]['chars'] += nchars
+            stats[stage]['count'] += 1
+
+
+# patterns used when expanding the included files
+_re_include = re.compile(r'\\(?:input|include)(?![A-Za-z@])')
+_re_thebibliography = re.compile(r'\\begin{thebibliography}')
+
+# on-disk cache of the parsed files (see '_load_file()')
+CACHE_DIRNAME = '.pysortex-cache'
+CACHE_MAXSIZE = 64*1024*1024 # bytes
+
+
+# patterns of the comment stripper: '\verb' with its delimiter, and the
+# beginning of the environments whose content is verbatim, or commented out
+_re_comment_verb = re.compile(r'\\verb\*?([^A-Za-z*\s])')
+_re_comment_env = re.compile(r'\\begin\s*{\s*(verbatim\*?|Verbatim\*?|lstlisting|minted|comment)\s*}')
+_re_comment_env_ends = {}
+
+
+def _skip_verbatim(text, m):
+    # end of the '\verb' or of the environment found by the match 'm'
+
+    if m.re is _re_comment_verb:
+        # '\verb|...|', on a single line
+        end = text.find(m.group(1), m.end())
+        if end < 0 or text.find('\n', m.end(), end) >= 0:
+            return m.end()
+        return end + 1
+
+    env = m.group(1)
+    re_end = _re_comment_env_ends.get(env)
+    if re_end is None:
+        re_end = re.compile(r'\\end\s*{\s*' + re.escape(env) + r'\s*}')
+        _re_comment_env_ends[env] = re_end
+    m_end = re_end.search(text, m.end())
+
+    return len(text) if m_end is None else m_end.end()
+
+
+
+def strip_comments(text):
+    r"""
+    returns 'text' without comments, i.e. the text from '%' until the end
+    of the line (the end of line is kept, so that the lines of the text are
+    unchanged) and the content of 'comment' environments (but for its ends
+    of line). The escaped '\%', the content of '\verb' and of the verbatim
+    environments ('verbatim', 'Verbatim', 'lstlisting', 'minted') are kept.
+
+    The text is scanned once: each '%' is looked for by 'str.find()', and
+    '\verb' and the environments by patterns beginning with a literal.
+    """
+
+    if '%' not in text and 'comment' not in text:
+        return text
+
+    chunks = []
+    start = 0 # beginning of the text not yet copied
+    pos = 0
+    m_verb = _re_comment_verb.search(text)
+    m_env = _re_comment_env.search(text)
+
+    while True:
+        i = text.find('%', pos)
+        if i < 0:
+            i = len(text)
+
+        # next '\verb' or environment, if before the next '%'
+        if m_verb is not None and m_verb.start() < pos:
+            m_verb = _re_comment_verb.search(text, pos)
+        if m_env is not None and m_env.start() < pos:
+            m_env = _re_comment_env.search(text, pos)
+        m = m_verb if m_env is None or (m_verb is not None and m_verb.start() < m_env.start()) else m_env
+
+        if m is not None and m.start() < i:
+            # '\verb' or '\begin' preceded by an odd number of '\' is not a command
+            k = m.start()
+            while k > pos and text[k-1] == '\\':
+                k -= 1
+            if (m.start()-k) % 2 == 1:
+                pos = m.start() + 1
+                continue
+            end = _skip_verbatim(text, m)
+            if m.re is _re_comment_env and m.group(1) == 'comment':
+                chunks.append(text[start:m.start()])
+                chunks.append('\n' * text.count('\n', m.start(), end))
+                start = end
+            pos = end
+            continue
+
+        if i == len(text):
+            break
+
+        # '%' preceded by an odd number of '\' is escaped
+        k = i
+        while k > pos and text[k-1] == '\\':
+            k -= 1
+        if (i-k) % 2 == 1:
+            pos = i + 1
+            continue
+
+        chunks.append(text[start:i])
+        end = text.find('\n', i)
+        start = pos = len(text) if end < 0 else end
+
+    chunks.append(text[start:])
+
+    return ''.join(chunks)
+
+
+
+# patterns of the argument reader: the braces (skipping the escaped
+# characters), the braces and the bracket closing an optional argument, and
+# an argument given without braces (e.g. '\input file')
+_re_argument_brace = re.compile(r'\\.|[{}]', re.S)
+_re_argument_bracket = re.compile(r'\\.|[{}\]]', re.S)
+_re_argument_bare = re.compile(r'[^\s{}\[\]%\\]+')
+_re_argument_space = re.compile(r'\s*')
+
+
+def _match_brace(text, pos, endpos, pattern, close):
+    # position following the 'close' ('}' or ']') of the group opened just
+    # before 'pos', matching the nested braces, or -1 if not closed
+
+    depth = 0
+    for m in pattern.finditer(text, pos, endpos):
+        c = m.group()
+        if c == '{':
+            depth += 1
+        elif depth == 0 and c == close:
+            return m.end()
+        elif c == '}':
+            if depth == 0:
+                return -1
+            depth -= 1
+
+    return -1
+
+
+
+def read_argument(text, pos, endpos=None, flag_bare=False):
+    r"""
+    reads the argument of the macro ending at position 'pos' of 'text' (e.g.
+    '{key}' of '\bibitem[label]{key}') and returns the argument without
+    braces and the position following it, or None if no argument is found
+    before 'endpos'. The optional arguments in brackets are skipped, and the
+    braces are matched, so that the argument may contain nested braces; if
+    'flag_bare', an argument without braces is read until the first white
+    space (e.g. '\input file').
+
+    The text is scanned once from 'pos', and only the argument is sliced.
+    """
+
+    if endpos is None:
+        endpos = len(text)
+
+    pos = _re_argument_space.match(text, pos, endpos).end()
+    while pos < endpos and text[pos] == '[':
+        end = _match_brace(text, pos+1, endpos, _re_argument_bracket, ']')
+        if end < 0:
+            return None
+        pos = _re_argument_space.match(text, end, endpos).end()
+
+    if pos < endpos and text[pos] == '{':
+        end = _match_brace(text, pos+1, endpos, _re_argument_brace, '}')
+        if end < 0:
+            return None
+        return text[pos+1:end-1], end
+
+    if flag_bare:
+        m = _re_argument_bare.match(text, pos, endpos)
+        if m is not None:
+            return m.group(), m.end()
+
+    return None
+
+
+
+def _find_tex_file(filename, dirname):
+    """
+    returns the name under which 'filename' is found in 'dirname' (the
+    extension '.tex' is added if needed), or None if there is no such file.
+    """
+
+    for filename_found in (filename, filename+'.tex'):
+        if os.path.isfile(os.path.join(dirname, filename_found)):
+            return filename_found
+
+    return None
+
+
+
+def _parse_text(filename, text, flag_stripcomments, stats=None):
+    r"""
+    returns a dictionary describing the text of a single file, without
+    expanding the included files:
+      'filename': name of the file
+      'text': text of the file (without comments, if 'flag_stripcomments')
+      'includes': list of [start, end, target] for each '\input{target}' or
+                  '\include{target}' (or '\input target'), where 'start'
+                  and 'end' delimit the macro and its argument in 'text'
+      'cites': list of [position, argument] for each citation command,
+               e.g. '\cite{argument}' or '\citep[p.~3]{argument}'
+      'bib': whether the text contains 'thebibliography' environment
+
+    The time spent is added to 'stats' (see 'new_stats()'), if given.
+    """
+
+    if flag_stripcomments:
+        with _timed(stats, 'comment_stripping', len(text)):
+            text = strip_comments(text)
+
+    includes = []
+    i = 0 # end of the previous \input or \include
+    for m in _re_include.finditer(text):
+
+        if m.start() < i:
+            continue # inside the argument of the previous \input or \include
+
+        argument = read_argument(text, m.end(), flag_bare=True)
+        if argument is None:
+            continue
+
+        target, i = argument
+        target = target.strip().strip('"') # e.g. '\input{"file name"}'
+        # a parameter, e.g. '\input{#1}' in the definition of a macro, is
+        # not a file (as for the citation commands)
+        if target and not target.startswith('#'):
+            includes.append([m.start(), i, target])
+
+    with _timed(stats, 'cite_parsing', len(text)):
+        cites = [[m.start(), m.group(1)] for m in _re_cite.finditer(text)]
+
+    return {'filename': filename, 'text': text, 'includes': includes,
+            'cites': cites, 'bib': _re_thebibliography.search(text) is not None}
+
+
+
+def _load_virtual_file(filename, files, flag_stripcomments, stats=None):
+    """
+    as '_load_file()', but 'filename' is looked up (adding the extension
+    '.tex' if needed) in 'files', a mapping of virtual file names to their
+    contents, so that nothing is read from disk.
+    """
+
+    for filename_found in (filename, filename+'.tex'):
+        for name in (filename_found, posixpath.normpath(filename_found)):
+            if name in files:
+                return _parse_text(name, files[name], flag_stripcomments, stats), False
+
+    return None, False
+
+
+
+def _cache_entry(cachedir, filenamepath, flag_stripcomments):
+    # name of the cache entry of a file
+    # the entries are not valid any more if the citation commands, the
+    # inclusions, or the stripping of comments, change
+    name = (f"{os.path.abspath(filenamepath)}\0{flag_stripcomments}\0{_re_cite.pattern}"
+            f"\0{_re_include.pattern}\0{_re_comment_env.pattern}")
+    return os.path.join(cachedir, hashlib.sha1(name.encode('utf-8', 'surrogatepass')).hexdigest()+'.json')
+
+
+
+def _cache_evict(cachedir, maxsize=CACHE_MAXSIZE):
+    """
+    removes the least recently used entries of the cache until the total
+    size of the cache is below 'maxsize' bytes.
+    """
+
+    try:
+        entries = [e for e in os.scandir(cachedir) if e.name.endswith('.json')]
+    except OSError:
+        return
+
+    entries = [(e.stat().st_mtime_ns, e.stat().st_size, e.path) for e in entries]
+    size = sum(e[1] for e in entries)
+
+    for mtime, entrysize, path in sorted(entries):
+        if size <= maxsize:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        size -= entrysize
+
+
+
+def _load_file(filename, dirname, flag_stripcomments, cachedir=None, records=None, 
+               records_prev=None, stats=None):
+    """
+    returns a tuple (record, flag_cached), where 'record' is the dictionary
+    returned by '_parse_text()' for 'filename' (None if the file cannot be
+    opened) and 'flag_cached' tells whether it was taken from a cache.
+
+    Arguments:
+       cachedir [optional]
+           directory of the on-disk cache, where the records are stored
+           keyed by size, modification time and hash of the content of the
+           file: a file is parsed again only if its content has changed
+       records [optional]
+           dictionary where the record is stored: it maps the path of each
+           file to a tuple ((size, modification time), record), or to None
+           if the file could not be found (so that its creation can be
+           detected, see 'watch()')
+       records_prev [optional]
+           dictionary as 'records', filled by a previous call and used as
+           in-memory cache
+       stats [optional]
+           see '_parse_text()'
+    """
+
+    filename_found = _find_tex_file(filename, dirname)
+
+    if filename_found is None:
+        if records is not None:
+            records[os.path.join(dirname, filename)] = None
+            records[os.path.join(dirname, filename+'.tex')] = None
+        return None, False
+
+    filenamepath = os.path.join(dirname, filename_found)
+    entry = None
+
+    try:
+        if cachedir is not None or records is not None:
+            stat = os.stat(filenamepath)
+            stamp = (stat.st_size, stat.st_mtime_ns)
+            if records_prev is not None and records_prev.get(filenamepath) is not None \
+                    and records_prev[filenamepath][0] == stamp:
+                records[filenamepath] = records_prev[filenamepath]
+                return records[filenamepath][1], True
+        with open(filenamepath, 'r') as f:
+            if cachedir is None:
+                record = _parse_text(filename_found, f.read(), flag_stripcomments, stats)
+                if records is not None:
+                    records[filenamepath] = (stamp, record)
+                return record, False
+            entrypath = _cache_entry(cachedir, filenamepath, flag_stripcomments)
+            try:
+                with open(entrypath, 'r', encoding='utf-8') as fc:
+                    entry = json.load(fc)
+            except (OSError, ValueError):
+                pass
+            if entry is not None and (entry['size'], entry['mtime']) == stamp:
+                os.utime(entrypath) # mark as recently used
+                if records is not None:
+                    records[filenamepath] = (stamp, entry['record'])
+                return entry['record'], True
+            text = f.read()
+    except OSError:
+        return None, False
+
+    digest = hashlib.sha1(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+    if entry is not None and entry['hash'] == digest:
+        record, flag_cached = entry['record'], True
+    else:
+        record, flag_cached = _parse_text(filename_found, text, flag_stripcomments, stats), False
+
+    if records is not None:
+        records[filenamepath] = (stamp, record)
+
+    entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest, 'record': record}
+
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        fd, entrypath_tmp = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fc:
+            json.dump(entry, fc)
+        os.replace(entrypath_tmp, entrypath)
+    except OSError:
+        _warning(S+f"WARNING: cannot write cache entry for file '{filename_found}'")
+
+    return record, flag_cached
+
+
+
+def _expand_includes(filename, dirname, flag_stripcomments, chunks, state):
+    r"""
+    appends to the list 'chunks' the text of 'filename', where the files
+    included by means of '\input{}' or '\include{}' are expanded in place,
+    and appends to the list state['cites'] the arguments of '\cite{}' in
+    order of appearance.
+
+    Each file is scanned only once: the text between two inclusions is
+    appended as it is, while the included files are expanded recursively,
+    so that the whole document is joined only once by the caller.
+
+    Arguments:
+       state
+           dictionary holding the number of files read so far ('filecount'),
+           the name of the file containing 'thebibliography' environment
+           ('filename_bib'), the list of the citations ('cites'), the
+           directory of the on-disk cache ('cachedir') and the dictionaries
+           of the records read now and in the previous call ('records' and
+           'records_prev'), see '_load_file()', the files already loaded
+           by '_load_files_parallel()' ('loaded'), the statistics ('stats',
+           see 'new_stats()') and the virtual files ('files', None if the
+           files are read from 'dirname', see '_load_virtual_file()')
+    """
+
+    if filename in state['loaded']:
+        record, flag_cached = state['loaded'][filename]
+    elif state['files'] is not None:
+        record, flag_cached = _load_virtual_file(filename, state['files'], flag_stripcomments, 
+                                                 state['stats'])
+    else:
+        record, flag_cached = _load_file(filename, dirname, flag_stripcomments, state['cachedir'], 
+                                         state['records'], state['records_prev'], state['stats'])
+
+    if record is None:
+        _error(S+f"ERROR: cannot open file '{filename}'")
+        return
+
+    text, cites = record['text'], record['cites']
+
+    if flag_stripcomments:
+        str_comment = "without comments]"
+    else:
+        str_comment = "with comments]"
+
+    if flag_cached:
+        str_comment += " (cached)"
+
+    _info(SS+f"reading file '{record['filename']}' [{len(text.splitlines())} lines...{str_comment}")
+
+    if record['bib']:
+        state['filename_bib'] = record['filename']
+
+    i = 0 # position of the text not yet appended to 'chunks'
+    k = 0 # first citation not yet appended to state['cites']
+    for start, end, target in record['includes']:
+
+        chunks.append(text[i:start])
+        while k < len(cites) and cites[k][0] < start:
+            state['cites'].append(cites[k][1])
+            k += 1
+
+        state['filecount'] += 1
+        _expand_includes(target, dirname, flag_stripcomments, chunks, state)
+        i = end
+
+    chunks.append(text[i:])
+    state['cites'].extend(c[1] for c in cites[k:])
+
+
+
+def _load_files_parallel(filename, dirname, flag_stripcomments, state, njobs):
+    r"""
+    loads 'filename' and all the files included by it (directly or not)
+    using 'njobs' threads, and returns a dictionary mapping the name of each
+    file (as written in '\input{}' or '\include{}') to the tuple returned
+    by '_load_file()'. Each included file is submitted as soon as the file
+    including it has been parsed. See '_expand_includes()' for 'state'.
+    """
+
+    loaded = {}
+    futures = {}
+
+    with concurrent.futures.ThreadPoolExecutor(njobs) as executor:
+
+        def submit(name):
+            # each thread sends its messages as the caller (see '_log()')
+            future = executor.submit(contextvars.copy_context().run, _load_file, name, dirname, flag_stripcomments, state['cachedir'], 
+                                     state['records'], state['records_prev'], state['stats'])
+            futures[future] = name
+
+        submit(filename)
+        submitted = {filename}
+
+        while futures:
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                loaded[name] = future.result()
+                for target in _new_includes(loaded[name][0], submitted):
+                    submit(target)
+
+    return loaded
+
+
+
+def parse_document(filename, dirname=None, flag_stripcomments=True, flag_cache=False, 
+                   records=None, njobs=1, stats=None, files=None, loaded=None):
+    r"""
+    returns a dictionary with the following items:
+      'text': string containing all the text of 'filename' file, including
+              the files possibily included
+      'nfiles': number of files read
+      'filename_bib': name of the file containing 'thebibliography'
+                      environment
+      'cites': list of the arguments of all '\cite{}' (in order of
+               appearance)
+
+    Arguments:
+       filename
+           name of the root file to parse (all the included files are
+           automatically sources into the file)
+       dirname [optional, default is working directory]
+           directory where the root file is located
+       flag_stripcomments [optional, default is True]
+           wether to strip off all comments or leave the comments in the 
+           parsed string
+       flag_cache [optional, default is False]
+           wether to keep the parsed files in the cache directory
+           CACHE_DIRNAME next to the root file, so that only the files
+           changed since the previous run are parsed again
+       records [optional]
+           dictionary used as in-memory cache of the parsed files (see
+           '_load_file()'), to be passed again to the following calls:
+           only the files changed in the meanwhile are parsed again, and
+           the files no longer included are removed from it
+       njobs [optional, default is 1]
+           number of threads used to read and parse the files (the result
+           does not depend on it)
+       stats [optional]
+           dictionary returned by 'new_stats()', where the time spent is
+           added
+       files [optional]
+           dictionary mapping the names of the files of the document
+           (relative to the root file) to their contents: if given, the
+           document is parsed from memory only ('dirname', 'flag_cache',
+           'records' and 'njobs' are ignored)
+       loaded [optional]
+           dictionary mapping the names of the files already loaded (as
+           written in '\input{}' or '\include{}') to the tuples returned
+           by '_load_file()', see 'bibsort_async()'
+    """
+
+    if files is not None:
+        dirname, flag_cache, records, njobs = '', False, None, 1
+        _info(S+f"in-memory document: {len(files)} files")
+    else:
+        if dirname is None:
+            dirname = os.getcwd()
+        dirnameabs = os.path.abspath(dirname)
+        _info(S+f"working directory: {dirnameabs}")
+
+    chunks = []
+    state = {'filecount': 1, 'filename_bib': '', 'cites': [], 
+             'cachedir': os.path.join(dirname, CACHE_DIRNAME) if flag_cache else None,
+             'records': {} if records is not None else None,
+             'records_prev': records, 'loaded': loaded or {}, 'stats': stats, 'files': files}
+
+    with _timed(stats, 'include_expansion'):
+
+        if njobs > 1:
+            state['loaded'] = _load_files_parallel(filename, dirname, flag_stripcomments, state, njobs)
+
+        _expand_includes(filename, dirname, flag_stripcomments, chunks, state)
+
+        text = ''.join(chunks)
+
+    if records is not None:
+        records.clear()
+        records.update(state['records'])
+
+    if flag_cache:
+        _cache_evict(state['cachedir'])
+
+    if stats is not None:
+        stats['include_expansion']['chars'] += len(text)
+
+    _info(S+f"read {state['filecount']} files [total of {len(text.splitlines())} lines]")
+    _info(S+f"thebibliography environment found in file '{state['filename_bib']}'")
+
+    return {'text': text, 'nfiles': state['filecount'], 
+            'filename_bib': state['filename_bib'], 'cites': state['cites']}
+
+
+
+def recursive_parser(filename, dirname=None, flag_stripcomments=True):
+    """
+    returns a tuple (text, nfiles, filename_bib), where 'text' is a string
+    containing all the text of 'filename' file, including the files
+    possibily included, 'nfiles' is the number of files read and
+    'filename_bib' is the name of the file containing 'thebibliography'
+    environment (see 'parse_document()').
+    
+    Arguments:
+       filename
+           name of the root file to parse (all the included files are
+           automatically sources into the file)
+       dirname [optional, default is working directory]
+           directory where the root file is located
+       flag_stripcomments [optional, default is True]
+           wether to strip off all comments or leave the comments in the 
+           parsed string
+    """
+
+    doc = parse_document(filename, dirname, flag_stripcomments)
+
+    return doc['text'], doc['nfiles'], doc['filename_bib']
+
+
+
+def break_multiple_cites(ll):
+
+    # split multiple citations (and remove blank spaces)
+    newll = []
+    for l in ll:
+        for x in l.split(','):
+            newll.append(x.strip(' \t\n\r'))
+    return newll
+
+
+
+def remove_duplicates_preserve_order(ll):
+
+    seen = set()
+    seen_add = seen.add # good for performance
+    return [ l for l in ll if not (l in seen or seen_add(l))]
+
+
+
+# names of the citation commands (the starred forms, e.g. '\cite*', are
+# included), more can be registered by means of 'add_cite_commands()'
+_cite_commands = [
+    # LaTeX
+    'cite', 'nocite', 
+    # natbib
+    'citep', 'citet', 'citealp', 'citealt', 'citeauthor', 'citeyear', 'citeyearpar', 
+    'citenum', 'Citep', 'Citet', 'Citealp', 'Citealt', 'Citeauthor', 
+    # biblatex
+    'parencite', 'Parencite', 'textcite', 'Textcite', 'autocite', 'Autocite', 
+    'footcite', 'footcitetext', 'smartcite', 'Smartcite', 'supercite', 'fullcite', 
+]
+
+
+def _regex_trie(names):
+    # regular expression matching any of 'names', factored by their common
+    # prefixes, so that each position is rejected by a few comparisons
+    groups = {}
+    flag_end = False
+    for name in names:
+        if name:
+            groups.setdefault(name[0], []).append(name[1:])
+        else:
+            flag_end = True
+    alternatives = [re.escape(c) + _regex_trie(rest) for c, rest in sorted(groups.items())]
+    if not alternatives:
+        return ''
+    pattern = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    return f"(?:{pattern})?" if flag_end else pattern
+
+
+
+def _build_cite_pattern():
+    r"""
+    returns the compiled pattern matching the citation commands, with up to
+    two optional arguments (e.g. '\citep[see][p.~3]{key}'): the group 1 is
+    the (mandatory) argument with the keys. The arguments beginning with '#'
+    (in the definitions of macros) are skipped.
+    """
+
+    return re.compile(r'\\' + _regex_trie(set(_cite_commands)) + r'(?![A-Za-z@])\*?'
+                      r'(?:\s*\[[^\]]*\]){0,2}\s*{(?!\s*#)([^}]*)}')
+
+
+_re_cite = _build_cite_pattern()
+
+
+def add_cite_commands(names):
+    r"""
+    registers the names of extra citation commands (e.g. ['citeA'] for
+    '\citeA{key}'), to be found together with the built-in ones.
+    """
+
+    global _re_cite
+
+    _cite_commands.extend(name.lstrip('\\') for name in names)
+    _re_cite = _build_cite_pattern()
+
+
+
+def parse_cites(text):
+
+    return collect_cites(_re_cite.findall(text))
+
+
+
+def collect_cites(cites):
+    r"""
+    returns the list of the keys cited, in order of first appearance, given
+    the list 'cites' of the arguments of all the citation commands (as
+    found by 'parse_cites()' or 'parse_document()'). The empty keys are
+    skipped, and '\nocite{*}' gives the key '*'.
+    """
+
+    ncites = len(cites)
+
+    # as 'break_multiple_cites()' followed by 'remove_duplicates_preserve_order()'
+    seen = set()
+    keys = []
+    for argument in cites:
+        for key in argument.split(','):
+            key = key.strip(' \t\n\r')
+            if key and key not in seen:
+                seen.add(key)
+                keys.append(key)
+    cites = keys
+    ncitesall = len(cites)
+
+    _info(S+f"parsed {ncitesall} different citations in {ncites} occurrencies of \\cite{'{}'}")
+
+    return cites
+
+
+
+# patterns used when parsing the entries of 'thebibliography' environment
+_re_thebibliography_begin = re.compile(r'\\begin\s*{\s*thebibliography\s*}')
+_re_thebibliography_end = re.compile(r'\\end\s*{\s*thebibliography\s*}')
+_re_bibitem_boundary = re.compile(r'\\bibitem(?![A-Za-z@])|\\end\s*{')
+_re_brace_close = re.compile(r'}')
+
+
+class Bibitem:
+    r"""
+    entry of 'thebibliography' environment, with the following attributes:
+      i: sequential number of the entry
+      text: text where the entry is found (shared by all the entries)
+      start, end: position of the entry in 'text', i.e. from '\bibitem{...}'
+                  until the beginning of the next entry (or, for the last
+                  entry, until '\end{thebibliography}')
+      j: sequential number of the entry after sorting (0 until sorted)
+      abc: key for the alphabetical sort, i.e. the string of 'create_abc()'
+           or the binary key of a collation (None until computed)
+      fields: authors, year and title of the entry, for the sort by fields
+              (see 'extract_fields()', None until computed)
+
+    The text of the entry ('item') is sliced from 'text' only when needed.
+    """
+
+    __slots__ = ('i', 'text', 'start', 'end', 'j', 'abc', 'fields')
+
+    def __init__(self, i, text, start, end, j=0, abc=None, fields=None):
+        self.i = i
+        self.text = text
+        self.start = start
+        self.end = end
+        self.j = j
+        self.abc = abc
+        self.fields = fields
+
+    @property
+    def item(self):
+        # full text of the entry
+        return self.text[self.start:self.end]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Bibitem(i={self.i}, start={self.start}, end={self.end}, j={self.j}, abc={self.abc!r})"
+
+
+
+def _add_bibitem(bibitems, text, ix, iend, i):
+    """
+    adds to 'bibitems' the entry of 'text' starting at position 'ix' (where
+    '\\bibitem' is found) and ending at position 'iend'.
+    """
+
+    # bibitem key, skipping the label of '\bibitem[label]{key}'
+    argument = read_argument(text, ix + len(r'\bibitem'), iend)
+    key = argument[0] if argument is not None else ''
+    key = key.strip(' \n\t\r') # strip all sort of white spaces from key 
+
+    bibitems[key] = Bibitem(i, text, ix, iend)
+
+
+
+def parse_bibitems(text):
+    """
+    Return a dictionary containing the entries of type '\bibitem{}' inside 
+    'thebibliography' environment (note that the entries outside the 
+    environment) are discareded. Raises ValueError if the environment has
+    no beginning or no end.
+
+    Arguments:
+       text
+           string to parse (as returned by 'recursive_parser()')
+
+    Note: The returned dictionary is made as follows:
+      key: the label of the item (i.e. the text inside braces in
+           '\bibitem{label}' or '\bibitem[text]{label}', after stripping
+           all white spaces)
+      value: a Bibitem, holding the sequential number of the entry ('i'),
+             its position in 'text' ('start' and 'end'), the sequential
+             number after sorting ('j') and the key for the alphabetical
+             sort ('abc', only defined when alphabetical sort is required)
+           
+    """
+
+    bibitems = dict()
+
+    i, i_before, i_after = 0, 0, 0
+    
+    # find the beginning of 'thebibiography' environment
+    m = _re_thebibliography_begin.search(text)
+    pos_thebibliography_start = m.start() if m is not None else -1
+        
+    # find the end of 'thebibiography' environment
+    m = _re_thebibliography_end.search(text)
+    pos_thebibliography_end = m.start() if m is not None else -1
+        
+    # check if 'thebibiography' environment has a start and an end
+    if pos_thebibliography_start < 0 or pos_thebibliography_end < pos_thebibliography_start:
+        raise ValueError("'thebibliography' environment not properly defined")
+
+    # single scan over all the '\bibitem' and '\end{': each entry ends
+    # where the following boundary begins (and never after the end of the
+    # environment), so that the text is never sliced but for extracting the
+    # keys and the entries themselves
+    ix = None # position of the '\bibitem' whose entry is still open
+    
+    for m in _re_bibitem_boundary.finditer(text):
+
+        if ix is not None:
+            i += 1 # \bibitem{*} inside 'thebibliography' environment
+            _add_bibitem(bibitems, text, ix, min(m.start(), pos_thebibliography_end), i)
+            ix = None
+
+        if m.group().startswith(r'\end'):
+            continue
+
+        if m.start() < pos_thebibliography_start:
+            
+            i_before += 1 # \bibitem{*} outside (before) 'thebibliography' environment
+            
+        elif m.start() > pos_thebibliography_end:
+            
+            i_after += 1 # \bibitem{*} outside (after) 'thebibliography' environment
+            
+        else:
+
+            ix = m.start()
+
+    if ix is not None:
+        i += 1
+        _add_bibitem(bibitems, text, ix, pos_thebibliography_end, i)
+
+    _info(S+f"parsed {i} occurencies of \\bibitem{'{}'} to process")
+    
+    if i_before > 0:
+        _info(S+f"parsed {i_before} occurencies of \\bibitem{'{}'} before 'thebibliography' environment (discarded)")
+        
+    if i_after > 0:
+        _info(S+f"parsed {i_after} occurencies of \\bibitem{'{}'} after 'thebibliography' environment (discarded)")
+
+    return bibitems
+
+
+### crea le stringhe da ordinare per autore
+
+# The strings for the alphabetic sort are obtained by applying in sequence
+# a list of precompiled regular expressions (see '_build_abc_steps()'): the
+# mappings of single characters are collected in the tables below and
+# replaced by a single pass of an alternation (rather than by
+# 'str.translate()', which looks up in the table each character of the
+# entry, and on the 10000 entries of 'benchmarks/bench_create_abc.py' takes
+# 0.10 s instead of 0.02 s). The order of the steps matters (e.g. the braces
+# are removed only after the formatting tags), so that different steps are
+# merged together only when this does not change the result.
+
+# mappings of single characters applied at the beginning
+_abc_chars = {
+    #   http://utf8-chartable.de/unicode-utf8-table.pl?start=64256&utf8=string-literal
+    '\ufb00': 'ff',  # latin small ligature ff
+    '\ufb01': 'fi',  # latin small ligature fi
+    '\ufb02': 'fl',  # latin small ligature fl
+    '\ufb03': 'ffi', # latin small ligature ffi
+    '\ufb04': 'ffl', # latin small ligature ffl
+    '\ufb05': 'st',  # latin small ligature long st
+    '\ufb06': 'st',  # latin small ligature st
+    #   http://www.utf8-chartable.de/unicode-utf8-table.pl?start=8192&number=128&utf8=string-literal
+    '\u2010': '-',   # hyphen
+    '\u2011': '-',   # non-breaking hyphen
+    '\u2012': '-',   # figure dash
+    '\u2013': '-',   # en dash
+    '\u2014': '-',   # em dash
+    '\u2015': '-',   # horizontal bar
+}
+
+# mappings of single characters which fold the accented letters to plain
+# ones (not applied for the collations, see 'collation_key()')
+_abc_fold_chars = {
+    # umlaut
+    'ä': 'a',
+    'ë': 'e',
+    'ï': 'i',
+    'ö': 'o',
+    'ü': 'u',
+    # other funny characters
+    'ß': 'ss',
+}
+
+# the same ligatures and dashes, as they appear when UTF-8 text is read
+# one byte per character
+_abc_bytes = {
+    '\xef\xac\x80': 'ff',
+    '\xef\xac\x81': 'fi',
+    '\xef\xac\x82': 'fl',
+    '\xef\xac\x83': 'ffi',
+    '\xef\xac\x84': 'ffl',
+    '\xef\xac\x85': 'st',
+    '\xef\xac\x86': 'st',
+    '\xe2\x80\x90': '-',
+    '\xe2\x80\x91': '-',
+    '\xe2\x80\x92': '-',
+    '\xe2\x80\x93': '-',
+    '\xe2\x80\x94': '-',
+    '\xe2\x80\x95': '-',
+}
+
+# extra rules registered by means of 'add_abc_rule()' and 'add_abc_chars()'
+_abc_user_chars = {}
+_abc_user_rules = []
+
+
+# LaTeX accents and letters, converted to Unicode when the accented letters
+# are not folded (see '_build_abc_steps()')
+_latex_accents = {"'": '\u0301', '`': '\u0300', '^': '\u0302', '~': '\u0303', '=': '\u0304', 
+                  '.': '\u0307', 'c': '\u0327', 'v': '\u030c', 'u': '\u0306', 'H': '\u030b', 
+                  'r': '\u030a', 'k': '\u0328'}
+_latex_letters = {'ss': 'ß', 'ae': 'æ', 'AE': 'Æ', 'oe': 'œ', 'OE': 'Œ', 'aa': 'å', 'AA': 'Å', 
+                  'o': 'ø', 'O': 'Ø', 'l': 'ł', 'L': 'Ł', 'i': 'i', 'j': 'j'}
+
+
+def _build_abc_steps(flag_fold=True):
+    """
+    returns the list of the steps applied by 'create_abc()': each step is a
+    compiled regular expression together with its replacement. If
+    'flag_fold' is False, the accented letters are kept (as Unicode
+    characters, also when written by means of LaTeX macros) for the
+    collations.
+    """
+
+    chars = dict(_abc_chars)
+    if flag_fold:
+        chars.update(_abc_fold_chars)
+    chars.update(_abc_user_chars)
+    chars.update(_abc_bytes)
+
+    # the sequences of '_abc_bytes' come first, since they begin with 'ï'
+    alternatives = sorted(chars, key=len, reverse=True)
+
+    steps = [
+        # strip out \bibitem{*} and all the possible whitespaces until the next word
+        (re.compile(r'\s*\\bibitem\s*(?:\[[^\]]*\]\s*)?{((?!#).+?)}\s*'), ''),
+        # replace the characters of the tables above
+        (re.compile('|'.join(map(re.escape, alternatives))), lambda m: chars[m.group()] or ''),
+    ]
+
+    if flag_fold:
+        # convert umlaut ('\"u' and '\"{u}')
+        steps.append((re.compile(r'\\"\s*(?:{\s*([aeiouAEIOU])\s*}|([aeiouAEIOU]))'), r'\1\2'))
+    else:
+        # convert letters ('\o', '\ss', ...) and accents ('\"u', '\'{e}', '\c{c}', ...)
+        steps.extend([
+            (re.compile(r'\\(ss|ae|AE|oe|OE|aa|AA|o|O|l|L|i|j)(?![A-Za-z])\s*(?:{})?'), 
+             lambda m: _latex_letters[m.group(1)]),
+            (re.compile(r'\\(["\'`^~=.])\s*(?:{\s*([A-Za-z])\s*}|([A-Za-z]))'), 
+             lambda m: (m.group(2) or m.group(3)) + _latex_accents.get(m.group(1), '\u0308')),
+            (re.compile(r'\\([cvuHrk])(?:\s*{\s*([A-Za-z])\s*}|\s+([A-Za-z]))'), 
+             lambda m: (m.group(2) or m.group(3)) + _latex_accents[m.group(1)]),
+        ])
+
+    steps.extend([
+        # convert other funny characters 
+        (re.compile(r'\\&'), ','),
+        # remove funny accents
+        (re.compile(r"\\['~´`]"), ''),
+        (re.compile(r"['~´`°]"), ''),
+        # remove strange things
+        (re.compile(r"\s\\\s"), ''), # remove \ with spaces on both sides
+    ])
+
+    steps.extend(_abc_user_rules)
+
+    # upper and lower case letters of the initials (possibly accented, if
+    # the accents are kept)
+    if flag_fold:
+        upper, lower = '[A-Z]', '[a-z]'
+    else:
+        upper, lower = '[A-ZÀ-ÖØ-ÞŁ][\u0300-\u036f]*', '[a-zß-öø-ÿł][\u0300-\u036f]*'
+
+    steps.extend([
+        # remove formatting tags
+        (re.compile(r'\\emph|\\textit|\\bold|\\normalsize'), ''),
+        (re.compile(r'\\[a-z]+{'), '{'),
+        # transform 'and' in ','
+        (re.compile(r'\sand\s'), ', '),
+        # remove indication of Editor(s)
+        (re.compile(r'\s\(Eds?.\)'), ','),
+        # remove all braces
+        (re.compile(r'[{}]'), ''),
+        # strip out the first name matching the following pattern: one or two
+        # letters followed by a dot, followed optionally by a whitespace and
+        # optionally preceded by a "-".
+        (re.compile(rf'-?{upper}(?:{lower})?\.\s*'), ''),
+        (re.compile(rf'\s-?{upper},'), ''),
+        # remove multiple "," and "-" which may result
+        (re.compile(r',\s*,'), ','),
+        (re.compile(r'-\s*-'), '-'),
+    ])
+
+    return steps
+
+
+_abc_steps = _build_abc_steps()
+_collation_steps = _build_abc_steps(False)
+
+
+
+def _abc_memo_clear():
+    # the memoized strings are no longer valid when the rules change
+    with _abc_memo_lock:
+        _abc_memo.clear()
+    _field_abc.cache_clear()
+
+
+
+def add_abc_chars(mapping):
+    """
+    registers extra mappings of single characters (e.g. {'Ä': 'A'}) to be
+    applied by 'create_abc()' together with the built-in ones (ligatures,
+    dashes, umlaut, etc.).
+
+    Arguments:
+       mapping
+           dictionary whose keys are single characters and whose values are
+           the replacing strings (or None to remove the character)
+    """
+
+    global _abc_steps, _collation_steps
+
+    _abc_user_chars.update(mapping)
+    _abc_steps = _build_abc_steps()
+    _collation_steps = _build_abc_steps(False)
+    _abc_memo_clear()
+
+
+
+def add_abc_rule(pattern, repl):
+    """
+    registers an extra substitution to be applied by 'create_abc()' (e.g. to
+    get rid of a LaTeX macro not handled by default). The extra rules are
+    applied in order of registration, after the conversion of special
+    characters and before the removal of formatting tags and braces.
+
+    Arguments:
+       pattern
+           regular expression (either a string or a compiled pattern)
+       repl
+           replacement, as for 're.sub()'
+    """
+
+    global _abc_steps, _collation_steps
+
+    _abc_user_rules.append((re.compile(pattern), repl))
+    _abc_steps = _build_abc_steps()
+    _collation_steps = _build_abc_steps(False)
+    _abc_memo_clear()
+
+
+
+def create_abc(bibitem, collation=None):
+    """
+    returns the string used to sort 'bibitem' in alphabetic order, i.e. the
+    text of the entry without '\\bibitem{...}', accents, formatting tags,
+    braces, initials and white spaces, converted to lowercase.
+
+    If 'collation' is given, the accents are kept and the binary sort key
+    of the string according to 'collation' is returned (see
+    'collation_key()').
+    """
+
+    abc = bibitem
+
+    for pattern, repl in (_abc_steps if collation is None else _collation_steps):
+        abc = pattern.sub(repl, abc)
+
+    # strip out all whitespaces
+    abc = ''.join(abc.split())
+
+    if collation is not None:
+        return collation_key(abc, collation)
+
+    return abc.lower()
+
+
+
+# The collations compare the strings on three levels, as in the Unicode
+# Collation Algorithm: the base letters first (primary level), then the
+# accents (secondary level) and finally the case (tertiary level). Each
+# collation is given by its alphabet, i.e. the letters having their own
+# primary weight, in order, and by the expansions of single characters into
+# sequences of letters sorted as them (e.g. 'ß' as 'ss'); any other
+# character is sorted as its base letter (e.g. 'é' as 'e', but after it).
+_latin_alphabet = 'abcdefghijklmnopqrstuvwxyz'
+_latin_expand = {'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 
+                 'þ': 'th', 'ı': 'i'}
+_nordic_expand = {key: value for key, value in _latin_expand.items() if key not in 'æø'}
+
+_collations = {
+    'root': (_latin_alphabet, _latin_expand),
+    # German, DIN 5007-1 ('ä' as 'a')
+    'de': (_latin_alphabet, _latin_expand),
+    # German, DIN 5007-2 ('ä' as 'ae')
+    'de-phonebook': (_latin_alphabet, {**_latin_expand, 'ä': 'ae', 'ö': 'oe', 'ü': 'ue'}),
+    # Swedish and Finnish ('å', 'ä', 'ö' after 'z')
+    'sv': (_latin_alphabet+'åäö', {**_nordic_expand, 'æ': 'ä', 'ø': 'ö'}),
+    'fi': (_latin_alphabet+'åäö', {**_nordic_expand, 'æ': 'ä', 'ø': 'ö'}),
+    # Danish and Norwegian ('æ', 'ø', 'å' after 'z')
+    'da': (_latin_alphabet+'æøå', {**_nordic_expand, 'ä': 'æ', 'ö': 'ø'}),
+    'nb': (_latin_alphabet+'æøå', {**_nordic_expand, 'ä': 'æ', 'ö': 'ø'}),
+    # Spanish ('ñ' after 'n')
+    'es': ('abcdefghijklmnñopqrstuvwxyz', _latin_expand),
+}
+
+# tables of 'str.translate()' of each collation (see '_CollationTable')
+_collation_tables = {}
+
+
+def _collation_weights(c, alphabet, expand):
+    # weights of the character 'c' on the three levels of a collation
+
+    lc = c.lower()
+
+    if unicodedata.combining(c):
+        return '', c, '' # accent not composed with the previous letter
+
+    letters, mark = lc, ''
+    if lc in expand:
+        letters, mark = expand[lc], '\x02'
+
+    primary, secondary = [], []
+    for letter in letters:
+        if letter in alphabet:
+            base, accents = letter, ''
+        else:
+            decomposed = unicodedata.normalize('NFD', letter)
+            base = ''.join(x for x in decomposed if not unicodedata.combining(x)) or decomposed
+            accents = ''.join(x for x in decomposed if unicodedata.combining(x))
+        for x in base:
+            k = alphabet.find(x)
+            if k >= 0:
+                primary.append(chr(0x61+k))
+            elif x < 'a':
+                primary.append(x)
+            else:
+                # above the letters of the alphabet
+                primary.append(chr(min(ord(x)+len(alphabet)-26, 0x10ffff)))
+        secondary.append(mark+accents+'\x01')
+        mark = ''
+
+    return ''.join(primary), ''.join(secondary), '\x01' if c == lc else '\x02'
+
+
+
+class _CollationTable(dict):
+    """
+    table of 'str.translate()' giving the weights of a level (0: primary, 1:
+    secondary, 2: tertiary) of a collation, filled when each character is
+    met for the first time.
+    """
+
+    def __init__(self, collation, level):
+        super().__init__()
+        self.collation = collation
+        self.level = level
+
+    def __missing__(self, code):
+        value = _collation_weights(chr(code), *_collations[self.collation])[self.level]
+        self[code] = value
+        return value
+
+
+
+def collation_key(text, collation='root'):
+    """
+    returns the binary sort key of 'text' according to 'collation' (one of
+    the names of '_collations', e.g. 'de' or 'sv', or registered by means
+    of 'add_collation()'), so that the strings are sorted by comparing
+    their keys only once.
+    """
+
+    tables = _collation_tables.get(collation)
+    if tables is None:
+        if collation not in _collations:
+            raise ValueError(f"unknown collation '{collation}'")
+        tables = tuple(_CollationTable(collation, level) for level in range(3))
+        _collation_tables[collation] = tables
+
+    text = unicodedata.normalize('NFC', text)
+
+    return b'\x00'.join(text.translate(table).encode('utf-8', 'surrogatepass') for table in tables)
+
+
+
+def add_collation(name, alphabet=None, expand=None, base='root'):
+    """
+    registers the collation 'name', tailoring the collation 'base'.
+
+    Arguments:
+       alphabet [optional, default is the alphabet of 'base']
+           string of the (lowercase) letters having their own primary
+           weight, in order: it must include all the letters from 'a' to
+           'z' (e.g. for Swedish, the latin alphabet followed by 'åäö')
+       expand [optional]
+           dictionary mapping single (lowercase) characters to the
+           sequences of letters they are sorted as (e.g. {'ä': 'ae'}),
+           added to those of 'base'
+    """
+
+    base_alphabet, base_expand = _collations[base]
+    _collations[name] = (alphabet or base_alphabet, {**base_expand, **(expand or {})})
+    _collation_tables.pop(name, None)
+    _abc_memo_clear()
+
+
+
+# The strings for the alphabetic sort are memoized, keyed by the text of the
+# entries: in-process, for the ABC_MEMO_MAXSIZE most recently used entries,
+# and optionally on disk, in a store of the cache directory (see
+# '_load_file()') keyed by the hash of the entries and named after the
+# rules in use, which keeps the ABC_STORE_MAXSIZE most recently used ones.
+# The keys of the collations are memoized separately for each collation.
+# Registering a rule or a collation empties the in-process memo.
+ABC_MEMO_MAXSIZE = 100000
+ABC_STORE_MAXSIZE = 100000
+
+_abc_memo = collections.OrderedDict()
+_abc_memo_lock = threading.Lock()
+
+
+def _abc_digest(item):
+    # key of an entry in the on-disk store
+    return hashlib.sha1(item.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+
+def _abc_memo_key(item, collation):
+    # key of an entry in the in-process memo
+    return item if collation is None else (collation, item)
+
+
+
+def _abc_store_path(cachedir, collation=None):
+    # the on-disk store is named after the rules of 'create_abc()'
+    rules = repr((version, _abc_chars, _abc_fold_chars, _abc_bytes, sorted(_abc_user_chars.items()), 
+                  [(pattern.pattern, pattern.flags, repr(repl)) for pattern, repl in _abc_user_rules],
+                  collation, _collations.get(collation)))
+    digest = hashlib.sha1(rules.encode('utf-8', 'surrogatepass')).hexdigest()
+    return os.path.join(cachedir, f"abc-{digest}.json")
+
+
+
+def _abc_lookup(bibitems, cachedir=None, collation=None):
+    """
+    sets the strings for the alphabetic sort (or the keys of 'collation')
+    of the entries of 'bibitems' found in the in-process memo or, if
+    'cachedir' is given, in the on-disk store, which is returned (None if
+    'cachedir' is None, or if all the strings are found in memory).
+    """
+
+    with _abc_memo_lock:
+        for value in bibitems.values():
+            if value.abc is None:
+                key = _abc_memo_key(value.item, collation)
+                abc = _abc_memo.get(key)
+                if abc is not None:
+                    _abc_memo.move_to_end(key)
+                    value.abc = abc
+
+    if cachedir is None or all(value.abc is not None for value in bibitems.values()):
+        return None
+
+    try:
+        with open(_abc_store_path(cachedir, collation), 'r', encoding='utf-8') as f:
+            store = json.load(f)
+    except (OSError, ValueError):
+        store = {}
+
+    found = []
+    for value in bibitems.values():
+        if value.abc is None:
+            abc = store.get(_abc_digest(value.item))
+            if abc is not None:
+                # the keys of the collations are stored in hexadecimal
+                value.abc = abc if collation is None else bytes.fromhex(abc)
+                found.append(value)
+
+    with _abc_memo_lock:
+        for value in found:
+            _abc_memo[_abc_memo_key(value.item, collation)] = value.abc
+
+    return store
+
+
+
+def _abc_remember(bibitems, store=None, cachedir=None, collation=None):
+    """
+    adds the strings for the alphabetic sort of 'bibitems' (some of which
+    have just been computed) to the in-process memo and, if new entries are
+    found, to the on-disk 'store' returned by '_abc_lookup()', which is then
+    written again.
+    """
+
+    with _abc_memo_lock:
+        for value in bibitems.values():
+            key = _abc_memo_key(value.item, collation)
+            _abc_memo[key] = value.abc
+            _abc_memo.move_to_end(key)
+        while len(_abc_memo) > ABC_MEMO_MAXSIZE:
+            _abc_memo.popitem(last=False)
+
+    if store is None:
+        return
+
+    abcs = {_abc_digest(value.item): value.abc if collation is None else value.abc.hex() 
+            for value in bibitems.values()}
+    if all(digest in store for digest in abcs):
+        return
+
+    # the entries in use are moved at the end, and the oldest ones dropped
+    for digest, abc in abcs.items():
+        store.pop(digest, None)
+        store[digest] = abc
+    for digest in list(itertools.islice(store, max(0, len(store)-ABC_STORE_MAXSIZE))):
+        del store[digest]
+
+    try:
+        os.makedirs(cachedir, exist_ok=True)
+        fd, storepath_tmp = tempfile.mkstemp(dir=cachedir, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(store, f)
+        os.replace(storepath_tmp, _abc_store_path(cachedir, collation))
+    except OSError:
+        _warning(S+"WARNING: cannot write the cache of the strings for the alphabetic sort")
+
+
+
+# minimum number of entries whose strings for the alphabetic sort are
+# computed in a pool of processes (see 'bibsort_async()')
+ASYNC_ABC_MINITEMS = 200
+
+
+def compute_abc(bibitems, cachedir=None, collation=None, process_executor=None):
+    """
+    sets the string for the alphabetical sort (see 'create_abc()'), or the
+    binary key of 'collation', of the entries of 'bibitems' (as returned by
+    'parse_bibitems()') for which it is not yet defined. Only the entries
+    never seen before are normalized, the others are taken from the memo
+    (see '_abc_lookup()'), kept also on disk in 'cachedir', if given.
+
+    If 'process_executor' (a ProcessPoolExecutor) is given, the entries to
+    normalize are split among its processes, if they are at least
+    ASYNC_ABC_MINITEMS.
+    """
+
+    if all(value.abc is not None for value in bibitems.values()):
+        return
+
+    store = _abc_lookup(bibitems, cachedir, collation)
+
+    missing = [value for value in bibitems.values() if value.abc is None]
+    if not missing:
+        return
+
+    if process_executor is not None and len(missing) >= ASYNC_ABC_MINITEMS:
+        size = -(-len(missing) // (os.cpu_count() or 1))
+        chunks = [missing[i:i+size] for i in range(0, len(missing), size)]
+        futures = [process_executor.submit(_create_abc_many, [value.item for value in chunk], 
+                                           _abc_user_chars, _abc_user_rules, 
+                                           collation, _collations.get(collation)) 
+                   for chunk in chunks]
+        for chunk, future in zip(chunks, futures):
+            for value, abc in zip(chunk, future.result()):
+                value.abc = abc
+    else:
+        for value in missing:
+            value.abc = create_abc(value.item, collation)
+
+    _abc_remember(bibitems, store, cachedir, collation)
+
+
+
+# Sort modes: the values of 'flag_sort' and the sort mode they stand for.
+# Besides the sort by call and the alphabetic one (by the whole text of the
+# entries), the entries can be sorted by the fields extracted from their
+# text (see 'extract_fields()'):
+#   author-year: by the authors, then by year and title
+#   year-author: by year, then by the authors and title
+#   author-count: by the first author, then by the number of the authors
+#                 (single author first), by year, co-authors and title
+# The entries without authors (or without year) are placed at the end.
+SORT_MODES = {'c': 'call', 'call': 'call', 
+              'a': 'alphabetic', 'alphabetic': 'alphabetic', 
+              'ay': 'author-year', 'author-year': 'author-year', 
+              'ya': 'year-author', 'year-author': 'year-author', 
+              'ac': 'author-count', 'author-count': 'author-count'}
+FIELD_SORT_MODES = ('author-year', 'year-author', 'author-count')
+
+
+def _sort_mode(flag_sort):
+    # any unknown value of 'flag_sort' stands for the alphabetic sort
+    return SORT_MODES.get(flag_sort, 'alphabetic')
+
+
+
+# fields of an entry: 'authors' is a tuple with the surnames of the authors
+# (or editors), 'year' a string (e.g. '2010' or '2010a'), or None if not
+# found, 'title' a string, or None if not found
+BibFields = collections.namedtuple('BibFields', ['authors', 'year', 'title'])
+
+_re_fields_bibitem = re.compile(r'\s*\\bibitem\s*(?:\[[^\]]*\])?\s*{[^}]*}\s*')
+_re_fields_year_paren = re.compile(r'\(\s*((?:1[5-9]|20)\d\d(?:[a-z](?![A-Za-z]))?)\s*\)')
+_re_fields_year = re.compile(r'(?<![\d.])((?:1[5-9]|20)\d\d(?:[a-z](?![A-Za-z]))?)(?!\d)')
+# beginning of a title in italics or between quotes
+_re_fields_title = re.compile(r'\\(?:emph|textit|textsl)\s*{|{\s*\\(?:em|it|sl)(?![a-z])|``|(?<!\\)"|\u201c')
+# separators of the authors (the braces are matched to skip their content)
+_re_fields_split = re.compile(r'[{}]|[,;]|\s+and\s+|\s*\\?&\s*')
+_re_fields_title_end = re.compile(r"[{}]|,|\.(?=\s|$)|''|\u201d|(?<!\\)\"")
+_re_fields_initial = re.compile(r'(?<![\w\\])-?(?:\\[\'`^"~=.]\s*)?[A-ZÀ-ÖØ-ÞŁ][a-z]?\.'
+                                r'(?:-(?:\\[\'`^"~=.]\s*)?[A-ZÀ-ÖØ-ÞŁ]\.)?')
+# end of the authors: a ':' or the end of a sentence, i.e. a '.' after a
+# word of three letters or more (not after an initial, nor after 'et al')
+_re_fields_authors_end = re.compile(r':|(?<=[A-Za-z][a-z]{2})\.(?=\s|$)')
+# names in Vancouver style, i.e. the surname followed by the initials
+# without dots ('Smith F, Doe J.'), where any '.' after a letter ends them
+# (a single name, as 'Smith F.', is not told apart from 'John A. Smith')
+_re_fields_vancouver = re.compile(r'\s*(?:[A-Z][^\s,.:]*\s+)+[A-Z]{1,3},')
+_re_fields_vancouver_end = re.compile(r':|(?<=[A-Za-z])\.(?=\s|$)')
+_re_fields_vancouver_initials = re.compile(r'\s+[A-Z]{1,3}$')
+_re_fields_editors = re.compile(r'\(\s*[Ee]ds?\.?\s*\)|\b[Ee]ds?\.(?=\s*$)')
+_re_fields_etal = re.compile(r'\bet\s*al\b\.?')
+_re_fields_macro_brace = re.compile(r'(\\[A-Za-z]+)\s*}')
+_re_fields_tie = re.compile(r'(?<!\\)~|\\ ')
+_re_fields_digit = re.compile(r'\d')
+_re_fields_tags = re.compile(r'\\(?:emph|textit|textbf|textsl|textsc|textrm|em|it|bf|sl|sc|rm)(?![a-z])\s*')
+
+
+def _clean_field(text):
+    # removes formatting tags, braces and ties from a field (a space is kept
+    # after the macros ending with a brace, e.g. 'Bj{\o}rk' gives 'Bj\o rk')
+    if '\\' in text:
+        text = _re_fields_tags.sub('', text)
+    if '}' in text:
+        text = _re_fields_macro_brace.sub(r'\1 ', text).replace('{', '').replace('}', '')
+    if '~' in text or '\\ ' in text:
+        text = _re_fields_tie.sub(' ', text)
+    return ' '.join(text.split())
+
+
+
+def _split_authors(text):
+    """
+    splits 'text' at the separators of the authors (',', ';', 'and', '&')
+    found outside braces, returning a list of the pieces, each one as a
+    tuple (separator preceding the piece, start, end).
+    """
+
+    pieces = []
+    depth, start, sep = 0, 0, ''
+    for m in _re_fields_split.finditer(text):
+        s = m.group()
+        if s == '{':
+            depth += 1
+        elif s == '}':
+            depth = max(depth-1, 0)
+        elif depth == 0:
+            pieces.append((sep, start, m.start()))
+            start, sep = m.end(), s.strip()
+    pieces.append((sep, start, len(text)))
+
+    return pieces
+
+
+
+def _author_name(piece, flag_vancouver=False):
+    """
+    returns the name in 'piece' (without initials, 'et al.' and the
+    indication of editors) and whether initials and 'et al.' were found.
+    If the initials are followed by a name (e.g. 'John A. Smith'), the name
+    is the one following them; if 'flag_vancouver', the initials without
+    dots after the name are dropped (e.g. 'Smith FJ').
+    """
+
+    if '(' in piece or 'ds.' in piece:
+        piece = _re_fields_editors.sub('', piece)
+    piece = _clean_field(piece)
+    etal = _re_fields_etal.search(piece) if 'al' in piece else None
+    if etal:
+        piece = piece[:etal.start()]
+    piece = piece.rstrip(' ,;:')
+    n = 0
+    if flag_vancouver:
+        piece, n = _re_fields_vancouver_initials.subn('', piece)
+    initials = list(_re_fields_initial.finditer(piece))
+    name = piece
+    if initials:
+        n += len(initials)
+        last = piece[initials[-1].end():]
+        name = last if last.strip(' .,;:-') else _re_fields_initial.sub('', piece)
+    name = ' '.join(name.split()).strip(' .,;:-')
+
+    return name, n > 0, etal is not None
+
+
+
+def _is_name(name):
+    # whether 'name' (without initials) looks like a name: a few words, one
+    # of them capitalized (possibly after an accent), and no digits
+    words = name.split()
+    if not words or len(words) > 4 or _re_fields_digit.search(name):
+        return False
+    return any(word.lstrip('\\\'`^"~=.')[:1].isupper() for word in words)
+
+
+
+def _surname(name, flag_initials):
+    # the surname is the whole name if the first names are given by their
+    # initials, else the last word with the particles preceding it (e.g.
+    # 'van der Waals')
+    words = name.split()
+    if flag_initials or len(words) < 2:
+        return name
+    k = len(words)-1
+    while k > 0 and words[k-1][:1].islower():
+        k -= 1
+    return ' '.join(words[k:])
+
+
+
+def extract_fields(bibitem):
+    r"""
+    returns the fields (a BibFields with the surnames of the authors, the
+    year and the title) of 'bibitem', i.e. the text of an entry of
+    'thebibliography' environment.
+
+    The authors are the names at the beginning of the entry (until a ':'
+    or the end of a sentence), separated by ',', ';', 'and' or '&', where
+    the first names are either given by their initials ('F.~Smith',
+    'Smith, F.', or 'Smith F' in Vancouver style), or the names are joined
+    by 'and'; 'et al.' and the indication of editors ('(Eds.)') are
+    dropped. The year
+    is the first one between parentheses, else the last one found in the
+    entry. The title is the text following the authors (or the year, if it
+    follows the authors) until the next ',' or '.', or the text between
+    quotes. Formatting tags ('\emph', '\textit', ...) and braces are
+    removed from the authors and the title.
+    """
+
+    text = _re_fields_bibitem.sub('', bibitem, count=1)
+    text = text.replace('\\newblock', ' ')
+
+    m = _re_fields_year_paren.search(text)
+    if m is None:
+        years = _re_fields_year.findall(text)
+        year = years[-1] if years else None
+        m = _re_fields_year.search(text)
+    else:
+        year = m.group(1)
+
+    # the authors are looked for before the title and before the year
+    iend = len(text)
+    title_start = _re_fields_title.search(text)
+    if title_start:
+        iend = title_start.start()
+    if m is not None:
+        iend = min(iend, m.start())
+    # ... and before a ':' or the end of a sentence
+    flag_vancouver = _re_fields_vancouver.match(text) is not None
+    authors_end = (_re_fields_vancouver_end if flag_vancouver else _re_fields_authors_end).search(text, 0, iend)
+    if authors_end:
+        iend = authors_end.start()
+
+    pieces = _split_authors(text[:iend])
+    # the names are extracted from the pieces only as long as needed
+    names = [None]*(len(pieces)+1)
+    names[-1] = ('', False, False)
+
+    def name_of(k):
+        if names[k] is None:
+            start, end = pieces[k][1:]
+            names[k] = _author_name(text[start:end], flag_vancouver)
+        return names[k]
+
+    authors = []
+    istart = iend
+    flag_style_initials = False
+    flag_style_inline = False # initials before the names (e.g. 'F.~Smith')
+    for k, (sep, start, end) in enumerate(pieces):
+        name, flag_initials, flag_etal = name_of(k)
+        if name:
+            flag_and = sep not in ('', ',', ';') or \
+                (k+1 < len(pieces) and pieces[k+1][0] not in (',', ';'))
+            next_name, flag_next_initials, _ = name_of(k+1)
+            # the initials after the name (e.g. 'Smith, F.') are not looked
+            # for once the authors have them before (e.g. 'F.~Smith, Title, J. 2001')
+            flag_next_initials = flag_next_initials and not next_name and not flag_style_inline
+            # the names without initials are accepted when joined by 'and'
+            # only if no author has initials (e.g. 'John Smith and Jane Doe'),
+            # or if joined by 'and' to the previous author (e.g. 'John A.
+            # Smith and Jane Doe')
+            flag_and_prev = sep not in ('', ',', ';') and bool(authors)
+            if not _is_name(name) or \
+               not (flag_initials or flag_next_initials or flag_and_prev or 
+                    (flag_and and not flag_style_initials)):
+                istart = start
+                break
+            flag_style_initials = flag_style_initials or flag_initials or flag_next_initials
+            flag_style_inline = flag_style_inline or (flag_initials and not flag_vancouver)
+            authors.append(_surname(name, flag_initials or flag_next_initials))
+        # else: initials of the previous author, indication of editors, etc.
+        if flag_etal:
+            etal = _re_fields_etal.search(text, start, iend)
+            istart = etal.end() if etal else iend
+            break
+
+    # the title follows the authors, or the year following them
+    if istart == iend and m is not None and m.start() == iend:
+        istart = m.end()
+    while istart < len(text) and text[istart] in ' \t\n.,:;)':
+        istart += 1
+    editors = _re_fields_editors.match(text, istart)
+    if editors:
+        istart = editors.end()
+
+    title = None
+    rest = text[istart:]
+    quote = re.match(r"``|(?<!\\)\"|\u201c", rest)
+    if quote:
+        rest = rest[quote.end():]
+    depth = 0
+    for t in _re_fields_title_end.finditer(rest):
+        s = t.group()
+        if s == '{':
+            depth += 1
+        elif s == '}':
+            depth = max(depth-1, 0)
+        elif depth == 0 and (not quote or s not in ',.'):
+            rest = rest[:t.start()]
+            break
+    title = _clean_field(rest).strip(' .,;:') or None
+
+    return BibFields(tuple(authors), year, title)
+
+
+
+# The fields of the entries are memoized in-process, keyed by the text of
+# the entries, as the strings for the alphabetic sort (see '_abc_memo'),
+# and the keys of the single fields, which are shared by many entries
+# (e.g. the surnames of the authors), are memoized by '_field_abc()'.
+_fields_memo = collections.OrderedDict()
+
+
+@functools.lru_cache(maxsize=ABC_MEMO_MAXSIZE)
+def _field_abc(text, collation=None):
+    # key of a field for the sort by fields
+    return create_abc(text, collation)
+
+
+
+def compute_fields(bibitems):
+    """
+    sets the fields (see 'extract_fields()') of the entries of 'bibitems'
+    (as returned by 'parse_bibitems()') for which they are not yet defined.
+    Only the entries never seen before are parsed, the fields of the others
+    are taken from the in-process memo.
+    """
+
+    missing = []
+    with _abc_memo_lock:
+        for value in bibitems.values():
+            if value.fields is None:
+                item = value.item
+                fields = _fields_memo.get(item)
+                if fields is None:
+                    missing.append((value, item))
+                else:
+                    _fields_memo.move_to_end(item)
+                    value.fields = fields
+
+    if not missing:
+        return
+
+    for value, item in missing:
+        value.fields = extract_fields(item)
+
+    with _abc_memo_lock:
+        for value, item in missing:
+            _fields_memo[item] = value.fields
+        while len(_fields_memo) > ABC_MEMO_MAXSIZE:
+            _fields_memo.popitem(last=False)
+
+
+
+def _field_sort_key(fields, mode, collation=None):
+    # key of an entry for the sort by fields in 'mode' (see 'SORT_MODES')
+
+    authors = tuple(_field_abc(author, collation) for author in fields.authors)
+    year = (fields.year is None, fields.year or '')
+    title = _field_abc(fields.title or '', collation)
+
+    if mode == 'year-author':
+        return (year, not authors, authors, title)
+    if mode == 'author-count':
+        return (not authors, authors[:1], len(authors), year, authors[1:], title)
+    return (not authors, authors, year, title)
+
+
+
+def sort_order(cites, bibitems, flag_sort, flag_verbose=True, collation=None):
+    """
+    sorts the entries of 'bibitems' (setting their sequential number 'j')
+    and returns the list of their keys in the new order, without assembling
+    the new bibliography (see 'make_new_bib()').
+    """
+
+    mode = _sort_mode(flag_sort)
+    if mode == 'call':
+        flag_sort_by_call = True
+        str_sort = 'by call'
+    else:
+        flag_sort_by_call = False
+        str_sort = mode if collation is None else f"{mode}, collation '{collation}'"
+    flag_sort_alphabetic = mode == 'alphabetic'
+    flag_sort_by_fields = mode in FIELD_SORT_MODES
+    
+
+    _info(SS+f"processing sorted bibliography ({str_sort} order)")
+
+    order = [] # keys of the entries, in the new order
+    i = 0
+
+    if flag_sort_by_call:
+        
+        i_nokey, i_nocite = 0, 0
+
+        for key in cites:
+
+            if key == '*' and key not in bibitems:
+                # '\nocite{*}': all the entries not yet cited, in their original order
+                for key_all, value in sorted(bibitems.items(), key=lambda item: item[1].i):
+                    if value.j < 1:
+                        order.append(key_all)
+                        i += 1
+                        value.j = i
+            elif key in bibitems:
+                if bibitems[key].j > 0:
+                    continue # already placed by '\nocite{*}'
+                order.append(key)
+                i += 1
+                bibitems[key].j = i
+            else:
+                if flag_verbose:
+                    _warning(SS+f"WARNING: citation '{key}' does not appear in the bibliography")
+                i_nokey += 1
+
+
+        if i < len(bibitems):
+
+            # the entries not cited are kept in their original order
+            sorted_bibitems = sorted(bibitems.items(), key=lambda item: item[1].i)
+            for item in sorted_bibitems:
+                if item[1].j < 1:
+                    if flag_verbose:
+                        _warning(SS+f"WARNING: bibitem '{item[0]}' (position #{item[1].i}) is not cited in the text (moved at the bottom)")
+                    key = item[0]
+                    order.append(key)
+                    i_nocite += 1
+                    i += 1
+                    bibitems[key].j = i
+
+        if i_nokey > 0:
+            _info(S+f"found {i_nokey} citations without a bibitem entry")
+
+        if i_nocite > 0:
+            _info(S+f"found {i_nocite} bibliography entries without citations (moved at the bottom)")
+
+        _info(S+f"{i} bibliography entries have been processed")
+
+    elif flag_sort_alphabetic:
+        
+        compute_abc(bibitems, None, collation)
+            
+        sorted_bibitems = sorted(bibitems.items(), key=lambda item: item[1].abc)
+        
+        for key, value in sorted_bibitems:
+            order.append(key)
+            i += 1
+            bibitems[key].j = i
+            
+            if collation is None:
+                _info(f"{i}: {bibitems[key].abc}")
+            else:
+                _info(f"{i}: {key}")
+
+    elif flag_sort_by_fields:
+
+        compute_fields(bibitems)
+
+        sorted_bibitems = sorted(bibitems.items(), 
+                                 key=lambda item: _field_sort_key(item[1].fields, mode, collation))
+
+        for key, value in sorted_bibitems:
+            order.append(key)
+            i += 1
+            value.j = i
+
+            fields = value.fields
+            _info(f"{i}: {key} ({'; '.join(fields.authors)}, {fields.year})")
+
+    return order
+
+
+
+def make_new_bib(cites, bibitems, flag_sort, flag_verbose=True, collation=None):
+    # new bibliography, i.e. the text of the entries in the order of 'sort_order()'
+    order = sort_order(cites, bibitems, flag_sort, flag_verbose, collation)
+    return ''.join(bibitems[key].item for key in order)
+
+
+
+
+
+# The backups of the files containing the bibliography are kept in the
+# directory BACKUP_DIRNAME, next to them. Each backup is stored once, named
+# by the hash of its content (and possibly compressed), and an index lists,
+# for each file, its backups numbered progressively, so that no backup is
+# made when the file is unchanged since the last one, and identical backups
+# share the same copy. The retention policy drops the oldest backups of a
+# file beyond the last BACKUP_KEEP ones and, when the backups of the
+# directory take more than BACKUP_MAXSIZE bytes, the oldest ones of any
+# file (None for no limit), but never the last backup of a file. The index
+# is updated under a lock on the file BACKUP_LOCKNAME of the store, so that
+# it is shared also by the processes of '--batch'.
+BACKUP_DIRNAME = '.pysortex-backup'
+BACKUP_KEEP = None
+BACKUP_MAXSIZE = None
+BACKUP_COMPRESS = False
+BACKUP_CHUNKSIZE = 1024*1024 # bytes
+BACKUP_LOCKNAME = 'index.lock'
+
+_backup_lock = threading.Lock()
+
+
+def _backup_store(filename):
+    # directory of the backups of 'filename' and name of the file in the index
+    filename = os.path.abspath(filename)
+    return os.path.join(os.path.dirname(filename), BACKUP_DIRNAME), os.path.basename(filename)
+
+
+
+@contextlib.contextmanager
+def _backup_locked(store):
+    # serializes the updates of the index of 'store', among threads and processes
+    with _backup_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(store, exist_ok=True)
+        with open(os.path.join(store, BACKUP_LOCKNAME), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+
+def _backup_index_load(store):
+    # index of the backup store, i.e. {'files': {name: {'next': n, 'backups': [...]}}}
+    try:
+        with open(os.path.join(store, 'index.json'), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    index.setdefault('files', {})
+    return index
+
+
+
+def _backup_index_save(store, index):
+    with _atomic_output(os.path.join(store, 'index.json')) as f:
+        json.dump(index, f, indent=1)
+
+
+
+def _file_digest(filename):
+    # hash and size of the content of 'filename', read in chunks
+    h = hashlib.sha1()
+    size = 0
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(BACKUP_CHUNKSIZE), b''):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+
+def _backup_retain(store, index, name, keep, maxsize, pinned=()):
+    """
+    drops from 'index' the backups beyond the retention policy (see
+    BACKUP_KEEP and BACKUP_MAXSIZE), but never the last backup of a file
+    nor the backups of 'name' whose numbers are in 'pinned', and removes
+    from 'store' the copies no longer referenced.
+    """
+
+    dropped = []
+    backups = index['files'][name]['backups']
+    if keep is not None and len(backups) > max(keep, 1):
+        old = backups[:len(backups)-max(keep, 1)]
+        dropped.extend(entry for entry in old if entry['n'] not in pinned)
+        backups[:len(old)] = [entry for entry in old if entry['n'] in pinned]
+
+    # number of references and size of each copy
+    refs = collections.Counter()
+    sizes = {}
+    for entry in itertools.chain.from_iterable(f['backups'] for f in index['files'].values()):
+        refs[entry['object']] += 1
+        sizes[entry['object']] = entry['stored']
+    for entry in dropped:
+        sizes.setdefault(entry['object'], entry['stored'])
+
+    if maxsize is not None:
+        total = sum(sizes[obj] for obj, count in refs.items() if count > 0)
+        kept = {id(f['backups'][-1]) for f in index['files'].values() if f['backups']}
+        kept.update(id(entry) for entry in backups if entry['n'] in pinned)
+        entries = sorted(((entry['time'], key, entry) for key, f in index['files'].items() 
+                          for entry in f['backups'] if id(entry) not in kept), key=lambda x: x[0])
+        for _, key, entry in entries:
+            if total <= maxsize:
+                break
+            index['files'][key]['backups'].remove(entry)
+            dropped.append(entry)
+            refs[entry['object']] -= 1
+            if refs[entry['object']] == 0:
+                total -= sizes[entry['object']]
+
+    for obj in {entry['object'] for entry in dropped if refs[entry['object']] <= 0}:
+        try:
+            os.remove(os.path.join(store, obj))
+        except OSError:
+            pass
+
+
+
+def make_backup_file(filename_in, keep=None, maxsize=None, flag_compress=None, pinned=()):
+    """
+    backs up 'filename_in' in the backup store of its directory (see
+    BACKUP_DIRNAME) and returns the number of the backup. No backup is made
+    if the file is unchanged since the last one, whose number is returned.
+
+    Arguments:
+       keep, maxsize, flag_compress [optional, default BACKUP_KEEP,
+       BACKUP_MAXSIZE and BACKUP_COMPRESS]
+           number of backups kept for the file, maximum size (bytes) of the
+           backups of the directory, and whether the backups are
+           compressed (gzip)
+       pinned [optional, default none]
+           numbers of the backups of the file never dropped by the
+           retention policy (e.g. the one being restored)
+    """
+
+    keep = BACKUP_KEEP if keep is None else keep
+    maxsize = BACKUP_MAXSIZE if maxsize is None else maxsize
+    flag_compress = BACKUP_COMPRESS if flag_compress is None else flag_compress
+
+    store, name = _backup_store(filename_in)
+    digest, size = _file_digest(filename_in)
+
+    with _backup_locked(store):
+
+        index = _backup_index_load(store)
+        record = index['files'].setdefault(name, {'next': 0, 'backups': []})
+
+        if record['backups'] and record['backups'][-1]['hash'] == digest:
+            n = record['backups'][-1]['n']
+            _info(S+f"input file containing bibliography unchanged since backup #{n}: no backup made")
+            return n
+
+        # identical backups (also of other files) share the same copy
+        for obj in (digest+'.tex', digest+'.tex.gz'):
+            if os.path.isfile(os.path.join(store, obj)):
+                break
+        else:
+            obj = digest + ('.tex.gz' if flag_compress else '.tex')
+            os.makedirs(store, exist_ok=True)
+            with open(filename_in, 'rb') as fin, _atomic_output(os.path.join(store, obj), 'wb') as fout:
+                if flag_compress:
+                    with gzip.GzipFile(fileobj=fout, mode='wb', mtime=0) as fz:
+                        shutil.copyfileobj(fin, fz, BACKUP_CHUNKSIZE)
+                else:
+                    shutil.copyfileobj(fin, fout, BACKUP_CHUNKSIZE)
+
+        n = record['next']
+        record['next'] = n + 1
+        record['backups'].append({'n': n, 'hash': digest, 'object': obj, 'size': size, 
+                                  'stored': os.path.getsize(os.path.join(store, obj)), 
+                                  'time': time.time()})
+
+        _backup_retain(store, index, name, keep, maxsize, pinned)
+        _backup_index_save(store, index)
+
+    _info(S+f"backup of input file containing bibliography: '{filename_in}' #{n} in '{store}'")
+
+    return n
+
+
+
+def list_backups(filename):
+    """
+    returns the list of the backups of 'filename' (see 'make_backup_file()'),
+    oldest first, as dictionaries with keys 'n' (number of the backup),
+    'time' (seconds since the epoch), 'size' (bytes) and 'hash'.
+    """
+
+    store, name = _backup_store(filename)
+    with _backup_lock:
+        index = _backup_index_load(store)
+
+    return [{key: entry[key] for key in ('n', 'time', 'size', 'hash')} 
+            for entry in index['files'].get(name, {}).get('backups', [])]
+
+
+
+def restore_backup(filename, n=None, filename_out=None):
+    """
+    restores the backup number 'n' (the last one, if None) of 'filename'
+    into 'filename_out' (by default 'filename' itself, whose current
+    content is backed up first) and returns the number of the backup.
+    Raises ValueError if there is no such backup.
+    """
+
+    store, name = _backup_store(filename)
+    with _backup_lock:
+        backups = _backup_index_load(store)['files'].get(name, {}).get('backups', [])
+    entries = [entry for entry in backups if n is None or entry['n'] == n]
+    if not entries:
+        raise ValueError(f"no backup of '{filename}'" + ('' if n is None else f" numbered {n}"))
+    entry = entries[-1]
+
+    if filename_out is None:
+        filename_out = filename
+        if os.path.isfile(filename):
+            make_backup_file(filename, pinned={entry['n']})
+
+    path = os.path.join(store, entry['object'])
+    with open(path, 'rb') as fin, _atomic_output(filename_out, 'wb') as fout:
+        if path.endswith('.gz'):
+            fin = gzip.GzipFile(fileobj=fin, mode='rb')
+        shutil.copyfileobj(fin, fout, BACKUP_CHUNKSIZE)
+
+    _info(S+f"backup #{entry['n']} of '{filename}' restored into '{filename_out}'")
+
+    return entry['n']
+
+
+
+
+def _map_file(filename):
+    """
+    returns a read-only memory map of 'filename' (an empty bytes string if
+    the file is empty, since empty files cannot be mapped).
+    """
+
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+
+# size of the chunks read by the streaming writer (in characters)
+WRITE_CHUNKSIZE = 1024*1024
+
+_re_thebibliography_begin_bytes = re.compile(_re_thebibliography_begin.pattern.encode('ascii'))
+_re_thebibliography_end_bytes = re.compile(_re_thebibliography_end.pattern.encode('ascii'))
+
+def _create_temp(dirname):
+    # temporary file in 'dirname', created with the permissions of a new
+    # file (0o666 less the umask, applied by the system)
+    while True:
+        filename_tmp = os.path.join(dirname, f"tmp{os.urandom(6).hex()}.tmp")
+        try:
+            fd = os.open(filename_tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 
+                         0o666)
+        except FileExistsError:
+            continue
+        return fd, filename_tmp
+
+
+
+def _fsync_dir(dirname):
+    # makes the renaming of a file in 'dirname' durable (where supported)
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(dirname, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+
+@contextlib.contextmanager
+def _atomic_output(filename, mode='w'):
+    """
+    yields a temporary file, in the directory of 'filename', which replaces
+    'filename' (keeping its permissions) when the block is completed, or is
+    removed if an exception is raised, so that 'filename' is never left
+    half-written. The temporary file is flushed to disk before replacing
+    'filename', so that not even a crash of the system leaves it empty. If
+    'filename' is a symbolic link, the file it points to is replaced.
+    """
+
+    filename = os.path.realpath(filename)
+    dirname_out = os.path.dirname(filename)
+    fd, filename_tmp = _create_temp(dirname_out)
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.isfile(filename):
+            shutil.copymode(filename, filename_tmp)
+        os.replace(filename_tmp, filename)
+    except BaseException:
+        os.remove(filename_tmp)
+        raise
+    _fsync_dir(dirname_out)
+
+
+
+def _bibliography_span(buf, re_begin, re_end):
+    r"""
+    returns the positions (i0, i1) of the content of 'thebibliography'
+    environment in 'buf' (a string, or bytes with the bytes patterns), i.e.
+    after the argument following '\begin{thebibliography}' and before
+    '\end{thebibliography}'.
+    """
+
+    m_begin = re_begin.search(buf)
+    if m_begin is None:
+        raise ValueError("'\\begin{thebibliography}' not found")
+    i0 = buf.find(b'}' if isinstance(buf, (bytes, mmap.mmap)) else '}', m_begin.end()) + 1
+    if i0 == 0:
+        raise ValueError("argument of '\\begin{thebibliography}' not found")
+    m_end = re_end.search(buf, i0)
+    if m_end is None:
+        raise ValueError("'\\end{thebibliography}' not found")
+
+    return i0, m_end.start()
+
+
+
+def _write_new_file_mmap(filename_bib_in, filename_bib_out, new_bib):
+    """
+    writes the new bibliography copying the text before and after
+    'thebibliography' environment straight from the memory map of
+    'filename_bib_in', so that the file is never read into memory as a
+    whole. The output is written to a temporary file which then replaces
+    'filename_bib_out' (which may be the input file itself).
+    """
+
+    buf = _map_file(filename_bib_in)
+
+    try:
+        i0, i1 = _bibliography_span(buf, _re_thebibliography_begin_bytes, 
+                                    _re_thebibliography_end_bytes)
+
+        with _atomic_output(filename_bib_out, 'wb') as f:
+            view = memoryview(buf)
+            f.write(view[:i0])
+            f.write(('\n' + new_bib + '\n').encode(locale.getpreferredencoding(False)))
+            f.write(view[i1:])
+            view.release()
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+
+
+def _stream_until(fin, fout, pattern, name, buf=''):
+    """
+    copies to 'fout' (or skips, if 'fout' is None) the text read from 'fin'
+    in chunks, preceded by 'buf', until 'pattern' is found; returns the text
+    matched and the text following it read so far (the 'buf' of the next
+    call). Raises ValueError if 'pattern' (described by 'name') is not
+    found.
+    """
+
+    while True:
+        m = pattern.search(buf)
+        if m is not None:
+            if fout is not None:
+                fout.write(buf[:m.start()])
+            return m.group(), buf[m.end():]
+
+        # the patterns contain a single backslash, so that only the text
+        # from the last one may be the beginning of a match
+        k = buf.rfind('\\')
+        if k < 0 or len(buf)-k > 1024:
+            k = len(buf)
+        if fout is not None:
+            fout.write(buf[:k])
+
+        chunk = fin.read(WRITE_CHUNKSIZE)
+        if not chunk:
+            raise ValueError(f"{name} not found")
+        buf = buf[k:] + chunk
+
+
+
+def _write_new_file_stream(filename_bib_in, filename_bib_out, new_bib):
+    """
+    writes the new bibliography reading 'filename_bib_in' in chunks of
+    WRITE_CHUNKSIZE characters: the text until the argument of
+    '\\begin{thebibliography}' is copied, the old entries are skipped, and
+    'new_bib' and the rest of the file are written, so that the file is
+    never held in memory as a whole. The output is written to a temporary
+    file which then replaces 'filename_bib_out' (which may be the input
+    file itself).
+    """
+
+    with open(filename_bib_in, 'r') as fin, _atomic_output(filename_bib_out) as fout:
+        begin, buf = _stream_until(fin, fout, _re_thebibliography_begin, 
+                                   "'\\begin{thebibliography}'")
+        fout.write(begin)
+        brace, buf = _stream_until(fin, fout, _re_brace_close, 
+                                   "argument of '\\begin{thebibliography}'", buf)
+        fout.write(brace)
+        end, buf = _stream_until(fin, None, _re_thebibliography_end, 
+                                 "'\\end{thebibliography}'", buf)
+        fout.write('\n')
+        fout.write(new_bib)
+        fout.write('\n')
+        fout.write(end)
+        fout.write(buf)
+        for chunk in iter(lambda: fin.read(WRITE_CHUNKSIZE), ''):
+            fout.write(chunk)
+
+
+
+def replace_bibliography(text, new_bib):
+    """
+    returns 'text' (the content of the file containing the bibliography)
+    where the content of 'thebibliography' environment is replaced by
+    'new_bib'.
+    """
+
+    i0, i1 = _bibliography_span(text, _re_thebibliography_begin, _re_thebibliography_end)
+
+    return text[:i0] + '\n' + new_bib + '\n'+ text[i1:]
+
+
+
+def write_new_file(filename_bib_in, filename_bib_out, new_bib, flag_mmap=False):
+    """
+    writes 'filename_bib_out', i.e. 'filename_bib_in' where the content of
+    'thebibliography' environment is replaced by 'new_bib'. The unchanged
+    parts of the file are copied in chunks (or, if 'flag_mmap' is True,
+    straight from its memory map) to a temporary file, which then replaces
+    'filename_bib_out', so that the output file is never left half-written.
+    Raises ValueError if 'thebibliography' environment is not found.
+    """
+
+    if flag_mmap:
+        _write_new_file_mmap(filename_bib_in, filename_bib_out, new_bib)
+    else:
+        _write_new_file_stream(filename_bib_in, filename_bib_out, new_bib)
+
+    _info(S+f"output file: '{filename_bib_out}'")
+
+
+
+
+def _path_in(dirname, filename):
+    # path of 'filename' in 'dirname', relative to the working directory if possible
+    path = os.path.join(dirname, filename)
+    try:
+        return os.path.relpath(path)
+    except ValueError:
+        return path
+
+
+
+def _order_unchanged(bibitems):
+    # whether the sorted bibliography has the same order of the original one
+    return all(value.j == value.i for value in bibitems.values())
+
+
+
+class SortResult:
+    """
+    result of 'sort_bibliography()', with the following attributes:
+      filename_in: name of the input file
+      filename_out: name of the output file (None until it is known)
+      filename_bib: path of the file containing the bibliography
+      text: for an in-memory document, the new content of the file
+            containing the bibliography (None otherwise, since the output
+            file is written without holding its text in memory)
+      new_bib: sorted entries of the bibliography (None if failed, or if
+               not assembled since the order is unchanged or in a dry run)
+      changed: True if the order of the entries has changed, False if
+               unchanged (None until sorted), see also 'diff()'
+      written: True if the output file has been written
+      bibitems: entries of the bibliography (see 'parse_bibitems()')
+      cites: keys cited, in order of first appearance
+      missing: keys cited without an entry in the bibliography
+      uncited: keys of the entries which are not cited (in original order)
+      error: description of the error (None if no error occurred)
+      messages: list of the pairs (level, message) sent while sorting,
+                where the level is as in module 'logging'
+      stats: statistics of the stages (see 'new_stats()'), or None
+    """
+
+    def __init__(self, filename_in, filename_out=None, stats=None):
+        self.filename_in = filename_in
+        self.filename_out = filename_out
+        self.filename_bib = None
+        self.text = None
+        self.new_bib = None
+        self.changed = None
+        self.written = False
+        self.bibitems = {}
+        self.cites = []
+        self.missing = []
+        self.uncited = []
+        self.error = None
+        self.messages = []
+        self.stats = stats
+
+    @property
+    def ok(self):
+        # True if the bibliography has been sorted
+        return self.error is None
+
+    @property
+    def warnings(self):
+        # warning and error messages
+        return [message for level, message in self.messages if level >= logging.WARNING]
+
+    def diff(self, n=0):
+        """
+        returns the lines of a unified diff, with 'n' lines of context,
+        between the keys of the entries in the original order and in the
+        new order (no lines if the order is unchanged).
+        """
+
+        if not self.changed:
+            return []
+        old = sorted(self.bibitems, key=lambda key: self.bibitems[key].i)
+        new = sorted(self.bibitems, key=lambda key: self.bibitems[key].j)
+        name = self.filename_bib or self.filename_in
+        return list(difflib.unified_diff(old, new, f"{name} (original order)", 
+                                         f"{name} (sorted)", n=n, lineterm=''))
+
+    def __repr__(self):
+        return (f"SortResult({self.filename_in!r}, ok={self.ok}, written={self.written}, "
+                f"nbibitems={len(self.bibitems)}, nwarnings={len(self.warnings)})")
+
+
+
+@contextlib.contextmanager
+def _collecting(messages, callback=None):
+    # appends to 'messages' the pairs (level, message) sent by '_log()' in
+    # the 'with' block, and passes them on to 'callback' (if None, to the
+    # collector already active, or to the logger)
+    if callback is None:
+        callback = _collector.get() or logger.log
+
+    def collect(level, message):
+        messages.append((level, message))
+        callback(level, message)
+
+    token = _collector.set(collect)
+    try:
+        yield
+    finally:
+        _collector.reset(token)
+
+
+
+def _sort_parse(result, dirname, flag_stripcomments, flag_cache, records, njobs, stats, 
+                files=None, loaded=None):
+    """
+    first part of '_bibsort()': parses the document of 'result' (a
+    SortResult) and sets its file names, citations and entries. Returns
+    False (setting the error of 'result') if the bibliography is not found.
+    """
+
+    doc = parse_document(result.filename_in, dirname, flag_stripcomments, flag_cache, records, 
+                         njobs, stats, files, loaded)
+    text = doc['text']
+
+    if doc['filename_bib'] == '':
+        result.error = "'thebibliography' environment not found"
+        _error(S+f"ERROR: {result.error}")
+        _error(S+"...execution failed :/")
+        return False
+
+    # the file containing the bibliography is found in 'dirname'
+    if files is None:
+        result.filename_bib = _path_in(dirname, doc['filename_bib'])
+    else:
+        result.filename_bib = doc['filename_bib']
+
+    if result.filename_out is None:
+        result.filename_out = result.filename_bib
+
+    with _timed(stats, 'cite_parsing'):
+        cites = collect_cites(doc['cites'])
+
+    try:
+        with _timed(stats, 'bibitem_parsing', len(text)):
+            bibitems = parse_bibitems(text)
+    except ValueError as e:
+        result.error = str(e)
+        _error(S+f"ERROR: {result.error}")
+        _error(S+"...execution failed :/")
+        return False
+
+    result.cites, result.bibitems = cites, bibitems
+    # '\nocite{*}' cites all the entries
+    result.missing = [key for key in cites if key not in bibitems and key != '*']
+    cited = set(cites)
+    result.uncited = [] if '*' in cited else [key for key in bibitems if key not in cited]
+
+    return True
+
+
+
+def _sort_normalize(result, flag_sort, cachedir=None, collation=None, stats=None, 
+                    process_executor=None):
+    """
+    second part of '_bibsort()': computes the keys of the entries of 'result'
+    needed by 'flag_sort', i.e. the strings for the alphabetic sort (kept
+    also in 'cachedir', if given, and computed in 'process_executor', if
+    given, see 'compute_abc()') or the fields (see 'compute_fields()').
+    """
+
+    mode = _sort_mode(flag_sort)
+    if mode != 'alphabetic' and mode not in FIELD_SORT_MODES:
+        return
+
+    with _timed(stats, 'key_normalization', 
+                sum(len(value) for value in result.bibitems.values())):
+        if mode == 'alphabetic':
+            compute_abc(result.bibitems, cachedir, collation, process_executor)
+        else:
+            compute_fields(result.bibitems)
+
+
+
+def _sort_write(result, flag_sort, flag_backup, flag_verbose, flag_mmap, 
+                flag_skip_unchanged=False, new_bib_prev=None, stats=None, files=None, 
+                collation=None, flag_dry_run=False):
+    """
+    last part of '_bibsort()': sorts the entries of 'result' (whose keys,
+    if needed, are already computed by '_sort_normalize()'), assembles the
+    new bibliography and writes the output file (see '_bibsort()' for
+    'flag_skip_unchanged' and 'flag_dry_run'). The file containing the
+    bibliography is always backed up before being overwritten.
+    """
+
+    bibitems = result.bibitems
+    flag_backup = flag_backup or result.filename_out == result.filename_bib
+
+    with _timed(stats, 'assembly'):
+        order = sort_order(result.cites, bibitems, flag_sort, flag_verbose, collation)
+    result.changed = not _order_unchanged(bibitems)
+
+    if flag_dry_run:
+        str_changed = 'changed' if result.changed else 'unchanged'
+        _info(S+f"order of the bibliography {str_changed}: output file not written (dry run)")
+        return
+
+    # the bibliography is not assembled if the file would be unchanged
+    if flag_skip_unchanged and files is None and not result.changed and \
+       result.filename_out == result.filename_bib:
+        _info(S+"order of the bibliography unchanged: output file not written")
+        return
+
+    with _timed(stats, 'assembly'):
+        new_bib = ''.join(bibitems[key].item for key in order)
+
+    result.new_bib = new_bib
+
+    if files is not None:
+        with _timed(stats, 'write', len(new_bib)):
+            result.text = replace_bibliography(files[result.filename_bib], new_bib)
+        _info(S+"done!")
+        return
+
+    if flag_skip_unchanged and result.filename_out != result.filename_bib and \
+       new_bib == new_bib_prev:
+        _info(S+"order of the bibliography unchanged: output file not written")
+        return
+
+    with _timed(stats, 'write', len(new_bib)):
+        if flag_backup:
+            try:
+                make_backup_file(result.filename_bib)
+            except OSError as e:
+                result.error = f"cannot back up the input file: {e}"
+                _error(S+f"cannot back up the input file '{result.filename_bib}': {e}")
+                _error(S+"...execution failed :/")
+                return
+        try:
+            write_new_file(result.filename_bib, result.filename_out, new_bib, flag_mmap)
+        except (OSError, ValueError) as e:
+            result.error = f"cannot write the output file: {e}"
+            _error(S+f"cannot write the output file '{result.filename_out}': {e}")
+            _error(S+"...execution failed :/")
+            return
+    result.written = True
+
+    _info(S+"done!")
+
+
+
+def _bibsort(filename_in, filename_out, dirname, flag_sort, flag_stripcomments,
+             flag_backup, flag_verbose, flag_mmap, flag_cache, njobs, records=None,
+             flag_skip_unchanged=False, new_bib_prev=None, stats=None, callback=None, 
+             files=None, collation=None, flag_dry_run=False):
+    """
+    body of 'sort_bibliography()' (without the total time), returning a
+    SortResult. See 'parse_document()' for 'records', 'stats' and 'files'
+    (for an in-memory document nothing is written, see 'sort_files()').
+
+    If 'flag_skip_unchanged' is True, the output file is not written when
+    the order of the entries is unchanged, or, if the output file is not the
+    input file, when the new bibliography is equal to 'new_bib_prev'. If
+    'flag_dry_run' is True, the entries are sorted but nothing is written
+    (see 'SortResult.changed' and 'SortResult.diff()').
+    """
+
+    result = SortResult(filename_in, filename_out, stats)
+
+    with _collecting(result.messages, callback):
+
+        if dirname is None and files is None:
+            dirname = os.getcwd()
+
+        if not _sort_parse(result, dirname, flag_stripcomments, flag_cache, records, njobs, 
+                           stats, files):
+            return result
+
+        _sort_normalize(result, flag_sort, 
+                        os.path.join(dirname, CACHE_DIRNAME) if flag_cache and files is None else None, 
+                        collation, stats)
+
+        _sort_write(result, flag_sort, flag_backup, flag_verbose, flag_mmap, 
+                    flag_skip_unchanged, new_bib_prev, stats, files, collation, flag_dry_run)
+
+    return result
+
+
+
+def print_banner():
+
+    print("*"*65)
+    print(f"* PySorTeX {version} -  Copyright (C) 2015, Andrea Mentrelli       *")
+    print("* This program comes with ABSOLUTELY NO WARRANTY.               *")
+    print("* This is free software, and you are welcome to redistribute it *")
+    print("* under certain conditions. For details, run the program with   *")
+    print("* the flag -w (i.e. python pysort.py -w)                        *")
+    print("*"*65)
+
+
+
+def sort_bibliography(filename_in, filename_out=None, dirname=None, 
+                      flag_sort='call', flag_stripcomments=True, flag_backup=True, 
+                      flag_verbose=True, flag_mmap=False, flag_cache=False, njobs=1, 
+                      stats=None, callback=None, collation=None, flag_skip_unchanged=True, 
+                      flag_dry_run=False):
     """
-    returns a string containing all the text of 'filename' file, including
-    the files possibily included.
-    
+    sorts the bibliography of 'filename_in' without printing anything, and
+    returns a SortResult.
+
+    If 'flag_skip_unchanged' is True [default], nothing is written (and no
+    backup is made) when the order of the entries is unchanged (pass False
+    to rewrite the file containing the bibliography anyway). If 'flag_dry_run' is
+    True, nothing is written at all: 'changed' of the result tells whether
+    the order would change, and its 'diff()' shows the keys moved.
+
+    If 'collation' is given (e.g. 'de' or 'sv', see 'collation_key()'), the
+    alphabetic sort compares the names according to it, accents included.
+
+    The messages are passed to 'callback(level, message)', if given (with
+    the level as in module 'logging'), else to the logger 'pysortex', which
+    is silent unless a handler is configured. In any case they are kept in
+    the 'messages' of the result.
+
+    If 'stats' is given (a dictionary returned by 'new_stats()'), the time
+    spent and the characters processed by each stage are added to it.
+    """
+
+    with _timed(stats, 'total'):
+        result = _bibsort(filename_in, filename_out, dirname, flag_sort, flag_stripcomments, 
+                          flag_backup, flag_verbose, flag_mmap, flag_cache, njobs, 
+                          flag_skip_unchanged=flag_skip_unchanged, stats=stats, 
+                          callback=callback, collation=collation, flag_dry_run=flag_dry_run)
+
+    return result
+
+
+
+def sort_files(files, filename_in, flag_sort='call', flag_stripcomments=True, 
+               flag_verbose=True, stats=None, callback=None, collation=None):
+    r"""
+    sorts the bibliography of a document held in memory, without reading or
+    writing any file, and returns a SortResult whose 'text' is the new
+    content of the file containing the bibliography (named 'filename_bib').
+
     Arguments:
-       filename
-           name of the root file to parse (all the included files are
-           automatically sources into the file)
-       dirname [optional, default is working directory]
-           directory where the root file is located
-       flag_stripcomments [optional, default is True]
-           wether to strip off all comments or leave the comments in the 
-           parsed string
+       files
+           dictionary mapping the names of the files of the document (as
+           written in '\input{}' or '\include{}', relative to the root
+           file) to their contents, or the content of the root file only
+       filename_in
+           name of the root file (a key of 'files')
+
+    See 'sort_bibliography()' for the other arguments.
     """
-      
-    
-    if dirname is None:
-        dirname = os.getcwd()
-        
-    filenamepath = os.path.join(dirname, filename)
-    
-    try:
-        f = open(filenamepath, 'r')
-        filename_found = filename
-    except:
-        try:
-            f = open(filenamepath+'.tex', 'r')
-            filename_found = filename+'.tex'
-        except:
-            filename_found = None
 
-    if filename_found is not None:
-        
-        filenamefoundpath = os.path.join(dirname, filename_found)
+    if isinstance(files, str):
+        files = {filename_in: files}
 
-        f = open(filenamefoundpath, 'r')
+    with _timed(stats, 'total'):
+        result = _bibsort(filename_in, None, None, flag_sort, flag_stripcomments, 
+                          False, flag_verbose, False, False, 1, stats=stats, 
+                          callback=callback, files=files, collation=collation)
 
-        text = f.read()
+    return result
 
-        if flag_stripcomments:
-            text = re.sub('(%.*\n)','', text) # strip off comments
-            str_comment = "without comments]"
-        else:
-            str_comment = "with comments]"
 
-        if _firstcall:
-            dirnameabs = os.path.abspath(dirname)
-            print(S+f"working directory: {dirnameabs}")
-        print(SS+f"reading file '{filename_found}' [{len(text.splitlines())} lines...{str_comment}")
 
-        pos = [m.start() for m in re.finditer(r'\\input{|\\include{', text)]
+def bibsort(filename_in, filename_out=None, dirname=None, \
+            flag_sort='call', flag_stripcomments=True, flag_backup=True, 
+            flag_verbose=True, flag_mmap=False, flag_cache=False, njobs=1, 
+            stats=None, collation=None, flag_text=True, flag_skip_unchanged=True):
+    """
+    sorts the bibliography of 'filename_in' as 'sort_bibliography()' and
+    returns a tuple (text, bibitems) with the text of the output file (None
+    if failed, or if 'flag_text' is False) and the entries of the
+    bibliography (see 'parse_bibitems()'). If the order of the entries is
+    unchanged, the file is not rewritten, and its text is returned as it is.
+
+    Note that the text is read back from the output file, which is written
+    without holding it in memory: for large files, pass flag_text=False,
+    or use 'sort_bibliography()'.
+    """
 
-        file_bib = [m.start() for m in re.finditer(r'\\begin{thebibliography}', text)]!=[]
+    result = sort_bibliography(filename_in, filename_out, dirname, flag_sort, 
+                               flag_stripcomments, flag_backup, flag_verbose, 
+                               flag_mmap, flag_cache, njobs, stats, collation=collation, 
+                               flag_skip_unchanged=flag_skip_unchanged)
 
-        if file_bib:
-            _filename_bib = filename_found
+    text = None
+    if flag_text and (result.written or result.ok and result.changed is False and 
+                      result.filename_out == result.filename_bib):
+        with open(result.filename_out, 'r') as f:
+            text = f.read()
 
-        while len(pos) > 0:
+    return text, result.bibitems
 
-            p = pos[0]
-            idx = [m.start() for m in re.finditer(r'{|}', text[p:-1])]
-            i0 = p + idx[0] # position of first '{' after \input or \include
-            i1 = p + idx[1] # position of first '}' after \input or \include
-            filename = text[i0+1:i1]
 
-            s, _filecount, _filename_bib = recursive_parser(filename, dirname, flag_stripcomments, False, _filecount+1, _filename_bib)
-            text = text[:p] + s + text[i1+1:]
 
-            pos = [m.start() for m in re.finditer(r'\\input{|\\include{', text)]
+_abc_executor = None
 
-        if _firstcall:
 
-            print(S+f"read {_filecount} files [total of {len(text.splitlines())} lines]")
-            print(S+f"thebibliography environment found in file '{_filename_bib}'")
+def _get_abc_executor():
+    # pool of processes shared by the calls of 'bibsort_async()'
+    global _abc_executor
+    if _abc_executor is None:
+        _abc_executor = concurrent.futures.ProcessPoolExecutor()
+    return _abc_executor
 
 
-        return text, _filecount, _filename_bib
 
-    else:
-        print(S+f"ERROR: cannot open file '{filename}'")
+def _run_in(executor, func, *args):
+    # runs 'func(*args)' in 'executor' (None for the default executor of
+    # the running loop), where the messages are sent as by the caller
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(executor, contextvars.copy_context().run, func, *args)
 
-    return text, _filecount, _filename_bib
 
 
+def _create_abc_many(items, user_chars, user_rules, collation=None, tailoring=None):
+    """
+    returns the list of the strings 'create_abc()' of 'items' (a list of
+    entries), in a worker process where the extra rules registered in the
+    calling process ('user_chars' and 'user_rules') and the tailoring of
+    'collation' are registered again.
+    """
 
-def break_multiple_cites(ll):
+    global _abc_steps, _collation_steps
 
-    # split multiple citations (and remove blank spaces)
-    newll = []
-    for l in ll:
-        for x in l.split(','):
-            newll.append(x.strip(' \t\n\r'))
-    return newll
+    if user_chars != _abc_user_chars or user_rules != _abc_user_rules:
+        _abc_user_chars.clear()
+        _abc_user_chars.update(user_chars)
+        _abc_user_rules[:] = user_rules
+        _abc_steps = _build_abc_steps()
+        _collation_steps = _build_abc_steps(False)
 
+    if collation is not None and _collations.get(collation) != tailoring:
+        _collations[collation] = tailoring
+        _collation_tables.pop(collation, None)
 
+    return [create_abc(item, collation) for item in items]
 
-def remove_duplicates_preserve_order(ll):
 
-    seen = set()
-    seen_add = seen.add # good for performance
-    return [ l for l in ll if not (l in seen or seen_add(l))]
 
+def _new_includes(record, submitted):
+    # targets included by 'record' (None if the file is not found) and not
+    # yet in 'submitted', to which they are added
+    if record is None:
+        return []
+    targets = []
+    for start, end, target in record['includes']:
+        if target not in submitted:
+            submitted.add(target)
+            targets.append(target)
+    return targets
 
 
-def parse_cites(text):
 
-    print(S+"parsed", end=' ')
+async def _load_files_async(filename, dirname, flag_stripcomments, cachedir, executor, stats):
+    """
+    as '_load_files_parallel()', but the files are read and parsed in
+    'executor' without blocking the running loop.
+    """
+
+    loaded = {}
+    pending = {}
 
-    cites = re.findall(r'\\cite{((?!#).+?)}', text)
-    ncites = len(cites)
+    def submit(name):
+        future = _run_in(executor, _load_file, name, dirname, flag_stripcomments, cachedir, 
+                         None, None, stats)
+        pending[future] = name
 
-    cites = break_multiple_cites(cites)
-    cites = remove_duplicates_preserve_order(cites)
-    ncitesall = len(cites)
+    submit(filename)
+    submitted = {filename}
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                loaded[name] = future.result()
+                for target in _new_includes(loaded[name][0], submitted):
+                    submit(target)
+    finally:
+        for future in pending:
+            future.cancel()
 
-    print(f"{ncitesall} different citations in {ncites} occurrencies of \\cite{'{}'}")
+    return loaded
 
-    return cites
 
 
+async def _bibsort_async(filename_in, filename_out, dirname, flag_sort, flag_stripcomments, 
+                         flag_backup, flag_verbose, flag_mmap, flag_cache, stats, callback, 
+                         executor, process_executor, collation, flag_skip_unchanged, 
+                         flag_dry_run):
+    # body of 'bibsort_async()' (without the timeout), as '_bibsort()'
 
-def parse_bibitems(text):
+    result = SortResult(filename_in, filename_out, stats)
+
+    with _timed(stats, 'total'), _collecting(result.messages, callback):
+
+        if dirname is None:
+            dirname = os.getcwd()
+
+        cachedir = os.path.join(dirname, CACHE_DIRNAME) if flag_cache else None
+        loaded = await _load_files_async(filename_in, dirname, flag_stripcomments, cachedir, 
+                                         executor, stats)
+
+        if not await _run_in(executor, _sort_parse, result, dirname, flag_stripcomments, 
+                             flag_cache, None, 1, stats, None, loaded):
+            return result
+
+        # the strings for the alphabetic sort are computed in a pool of processes
+        await _run_in(executor, _sort_normalize, result, flag_sort, cachedir, collation, stats, 
+                      process_executor or _get_abc_executor())
+
+        # the output file is written by a single call, which is completed
+        # even if the coroutine is cancelled in the meanwhile
+        await _run_in(executor, _sort_write, result, flag_sort, flag_backup, flag_verbose, 
+                      flag_mmap, flag_skip_unchanged, None, stats, None, collation, 
+                      flag_dry_run)
+
+    return result
+
+
+
+async def bibsort_async(filename_in, filename_out=None, dirname=None, 
+                        flag_sort='call', flag_stripcomments=True, flag_backup=True, 
+                        flag_verbose=True, flag_mmap=False, flag_cache=False, stats=None, 
+                        callback=None, executor=None, process_executor=None, timeout=None, 
+                        collation=None, flag_skip_unchanged=True, flag_dry_run=False):
     """
-    Return a dictionary containing the entries of type '\bibitem{}' inside 
-    'thebibliography' environment (note that the entries outside the 
-    environment) are discareded.
+    coroutine sorting the bibliography as 'sort_bibliography()', without
+    blocking the running loop, and returning a SortResult. The files are
+    read and parsed in 'executor', and the strings for the alphabetic sort
+    are computed in 'process_executor', so that many documents can be
+    sorted concurrently.
+
+    The coroutine can be cancelled at any time: the stages already running
+    in the executors are completed, but their results are discarded (the
+    output file, however, is either written as a whole or not at all).
 
     Arguments:
-       text
-           string to parse (as returned by 'recursive_parser()')
+       executor [optional, default is the default executor of the loop]
+           executor (e.g. a ThreadPoolExecutor with a bounded number of
+           threads, shared by all the requests) where the files are read,
+           parsed and written
+       process_executor [optional]
+           ProcessPoolExecutor where the strings for the alphabetic sort
+           are computed (only for at least ASYNC_ABC_MINITEMS entries); by
+           default, a pool shared by all the calls is created when first
+           needed. The rules registered by means of 'add_abc_rule()' must
+           be picklable
+       timeout [optional]
+           seconds after which the coroutine is cancelled and
+           asyncio.TimeoutError is raised
+
+    See 'sort_bibliography()' for the other arguments.
+    """
 
-    Note: The returned dictionary is made as follows:
-      key: the label of the item (i.e. the text inside braces in
-           '\bibitem{label}', after stripping all white spaces)
-      value: a list [i, item, ], where:
-             i: sequential number of the entry
-             item: full text entry, i.e. all text of the entry, including 
-                   '\bibitem{...}' until the beginning of the next entry (or,
-                   for the last entry, until '\end{thebibliography})
-             j: sequential number of the entry after sorting
-             abc: string for the alphabetical sort (only defined when 
-                  alphabetical sort is required)
-           
+    coro = _bibsort_async(filename_in, filename_out, dirname, flag_sort, flag_stripcomments, 
+                          flag_backup, flag_verbose, flag_mmap, flag_cache, stats, callback, 
+                          executor, process_executor, collation, flag_skip_unchanged, 
+                          flag_dry_run)
+
+    if timeout is None:
+        return await coro
+
+    return await asyncio.wait_for(coro, timeout)
+
+
+
+def _file_stamps(records):
+    # size and modification time of the files in 'records' (None if missing)
+    stamps = {}
+    for filenamepath in records:
+        try:
+            stat = os.stat(filenamepath)
+            stamps[filenamepath] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            stamps[filenamepath] = None
+    return stamps
+
+
+
+def _read_stamps(records, result):
+    # size and modification time of the files in 'records' when they were
+    # read (so that the changes saved while sorting are not missed), but for
+    # the output file, whose stamp is taken after writing it
+    stamps = {filenamepath: None if record is None else record[0] 
+              for filenamepath, record in records.items()}
+    if result.written:
+        filename_out = os.path.abspath(result.filename_out)
+        stamps.update(_file_stamps([filenamepath for filenamepath in stamps 
+                                    if os.path.abspath(filenamepath) == filename_out]))
+    return stamps
+
+
+
+def watch(filename_in, filename_out=None, dirname=None, \
+          flag_sort='call', flag_stripcomments=True, flag_backup=True, 
+          flag_verbose=True, flag_mmap=False, flag_cache=False, njobs=1, interval=1.0, 
+          callback=None, collation=None):
+    """
+    sorts the bibliography as 'bibsort()', then keeps polling the files of
+    the document every 'interval' seconds (until interrupted by Ctrl-C).
+
+    The file containing the bibliography is rewritten only if the order of
+    its entries is changed. When some file changes, only the changed files
+    are parsed again (the others are kept in memory) and the output file is
+    written only if the sorted bibliography is changed.
+    The messages are sent as by 'sort_bibliography()'.
     """
 
-    print(S+"parsed", end=' ')
-    bibitems = dict()
+    if dirname is None:
+        dirname = os.getcwd()
+
+    records = {}
+    result = _bibsort(filename_in, filename_out, dirname, flag_sort, flag_stripcomments, 
+                      flag_backup, flag_verbose, flag_mmap, flag_cache, njobs, records, 
+                      True, callback=callback, collation=collation)
+    stamps = _read_stamps(records, result)
+
+    with _collecting([], callback):
+        _info(S+f"watching {sum(1 for x in stamps.values() if x is not None)} files (press Ctrl-C to stop)")
 
-    i, i_before, i_after = 0, 0, 0
-    
-    # find the beginning of 'thebibiography' environment
-    try:
-        pos_thebibliography_start = [m.start() for m in re.finditer(r'\\begin\s*{\s*thebibliography\s*}', text)][0]
-    except:
-        pos_thebibliography_start = -1
-        
-    # find the end of 'thebibiography' environment
     try:
-        pos_thebibliography_end = [m.start() for m in re.finditer(r'\\end\s*{\s*thebibliography\s*}', text)][0]
-    except:
-        pos_thebibliography_end = -1
-        
-    # check if 'thebibiography' environment has a start and an end
-    if pos_thebibliography_start < 0 or pos_thebibliography_end < 0:
-        print("ERROR: 'thebibliography' environment not properly defined")
-        
-    # loop over all the '\bibitem{*}' in the text
-    for ix in [m.start() for m in re.finditer(r'\\bibitem{', text)]:
+        while True:
 
-        if ix < pos_thebibliography_start:
-            
-            i_before += 1 # \bibitem{*} outside (before) 'thebibliography' environment
-            
-        elif ix > pos_thebibliography_end:
-            
-            i_after += 1 # \bibitem{*} outside (after) 'thebibliography' environment
-            
-        else:
-            
-            i += 1 # \bibitem{*} inside 'thebibliography' environment
+            time.sleep(interval)
 
-            idx = [m.start() for m in re.finditer(r'{|}', text[ix:-1])]
-            i0 = ix + idx[0] # position of first '{' after \bibitem
-            i1 = ix + idx[1] # position of first '}' after \bibitem
-            key = text[i0+1:i1] # bibitem key
-            key = key.strip(' \n\t\r') # strip all sort of white spaces from key 
+            stamps_new = _file_stamps(records)
+            if stamps_new == stamps:
+                continue
 
-            idx = [m.start() for m in re.finditer(r'\\bibitem{|\\end{', text[ix:-1])]
-            i1 = ix + idx[1] # position of end of \bibitem{}
-            item = text[ix:i1]
+            for filenamepath in stamps_new:
+                if stamps_new[filenamepath] != stamps.get(filenamepath):
+                    with _collecting([], callback):
+                        _info(S+f"file changed: '{os.path.relpath(filenamepath, dirname)}'")
 
-            bibitems[key] = [i, item, 0, None]
+            result = _bibsort(filename_in, filename_out, dirname, flag_sort, flag_stripcomments, 
+                              flag_backup, flag_verbose, flag_mmap, flag_cache, njobs, records, 
+                              True, result.new_bib, callback=callback, collation=collation)
+            stamps = _read_stamps(records, result)
 
-    print(f"{i} occurencies of \\bibitem{'{}'} to process")
-    
-    if i_before > 0:
-        print(S+"parsed", end=' ')
-        print(f"{i_before} occurencies of \\bibitem{'{}'} before 'thebibliography' environment (discarded)")
-        
-    if i_after > 0:
-        print(S+"parsed", end=' ')
-        print(f"{i_after} occurencies of \\bibitem{'{}'} after 'thebibliography' environment (discarded)")
+    except KeyboardInterrupt:
+        with _collecting([], callback):
+            _info(S+"stopped watching")
 
-    return bibitems
 
 
-### crea le stringhe da ordinare per autore
-def create_abc(bibitem):
-    
-    #bibitem = bibitem.decode('utf-8', 'ignore')
-    
-    # strip out \bibitem{*} and all the possible whitespaces until the next word
-    abc = re.sub(r'\s*\\bibitem\s*{((?!#).+?)}\s*', '', bibitem)
-    
-    # replace some unicode characters
-    #   http://utf8-chartable.de/unicode-utf8-table.pl?start=64256&utf8=string-literal
-    abc = re.sub(r'\xef\xac\x80', r'ff', abc) # latin small ligature ff
-    abc = re.sub(r'\xef\xac\x81', r'fi', abc) # latin small ligature fi
-    abc = re.sub(r'\xef\xac\x82', r'fl', abc) # latin small ligature fl
-    abc = re.sub(r'\xef\xac\x83', r'ffi', abc) # latin small ligature ffi
-    abc = re.sub(r'\xef\xac\x84', r'ffl', abc) # latin small ligature ffl
-    abc = re.sub(r'\xef\xac\x85', r'st', abc) # latin small ligature long st
-    abc = re.sub(r'\xef\xac\x86', r'st', abc) # latin small ligature st
-    #   http://www.utf8-chartable.de/unicode-utf8-table.pl?start=8192&number=128&utf8=string-literal
-    abc = re.sub(r'\xe2\x80\x90', r'-', abc) # hyphen
-    abc = re.sub(r'\xe2\x80\x91', r'-', abc) # non-breaking hyphen
-    abc = re.sub(r'\xe2\x80\x92', r'-', abc) # figure dash
-    abc = re.sub(r'\xe2\x80\x93', r'-', abc) # en dash
-    abc = re.sub(r'\xe2\x80\x94', r'-', abc) # em dash
-    abc = re.sub(r'\xe2\x80\x95', r'-', abc) # horizontal bar
-    
-    # convert umlaut
-    abc = re.sub(r'ä', r'a', abc)
-    abc = re.sub(r'ë', r'e', abc)
-    abc = re.sub(r'ï', r'i', abc)
-    abc = re.sub(r'ö', r'o', abc)
-    abc = re.sub(r'ü', r'u', abc)
-    abc = re.sub(r'\\"\s*([aeiouAEIOU])', r'\1', abc)
-    abc = re.sub(r'\\"\s*{\s*([aeiouAEIOU])\s*}', r'\1', abc)
-    
-    # convert other funny characters 
-    abc = re.sub(r'ß', r'ss', abc) 
-    abc = re.sub(r'\\&', r',', abc)
-    abc = re.sub(r'–', r'-', abc)
-    
-    # remove funny accents
-    abc = re.sub(r"\\'|'", r'', abc)
-    abc = re.sub(r"\\~|~", r'', abc)
-    abc = re.sub(r"\\´|´", r'', abc)
-    abc = re.sub(r"\\`|`", r'', abc)
-    abc = re.sub(r"°", r'', abc)
-    
-    # remove strange things
-    abc = re.sub(r"\s\\\s", r'', abc) # remove \ with spaces on both sides
-    
-    
-    # remove formatting tags
-    abc = re.sub(r'\\emph', r'', abc)
-    abc = re.sub(r'\\textit', r'', abc)
-    abc = re.sub(r'\\bold', r'', abc)
-    abc = re.sub(r'\\normalsize', r'', abc)
-    
-    abc = re.sub(r'\\[a-z]+{', r'{', abc)
-    
-    # transform 'and' in ','    
-    abc = re.sub(r'\sand\s', r', ', abc)
-    
-    # remove indication of Editor(s)
-    abc = re.sub(r'\s\(Ed.\)', r',', abc)
-    abc = re.sub(r'\s\(Eds.\)', r',', abc)       
-    
-    # remove all braces
-    abc = re.sub(r'{|}', r'', abc)
-    
-    
-    # strip out the first name matching the following pattern: one or two
-    # letters followed by a dot, followed optionally by a whitespace and
-    # optionally preceded by a "-".
-    abc = re.sub(r'-?([A-Z][a-z]?)\.\s*', r'', abc)
-    abc = re.sub(r'\s-?[A-Z],', r'', abc)
-    
-    
-    # remove multiple "," and "-" which may result
-    abc = re.sub(r',\s*,', r',', abc)
-    abc = re.sub(r'-\s*-', r'-', abc)
-    
-    # strip out all whitespaces
-    abc = re.sub(r'\s', r'', abc)
-    
-    abc = abc.lower()
-    
+
+def _bibsort_batch_job(filename, flag_sort, flag_stripcomments, flag_backup, 
+                       flag_verbose, flag_mmap, flag_cache, collation=None, 
+                       flag_skip_unchanged=False, flag_dry_run=False, cite_commands=None, 
+                       backup_settings=None):
     """
-    #abc = re.sub('\s\\\\\s', ' ', abc)
-    abc = re.sub('(T\.R)', 'T. R ', abc)
-    line = re.sub('({\\\\"\s*u})|(\\\\"{u})|(\\\\"u)', 'u', line)
-    #line = re.sub('({\\\\''\s*c})|(\\\\''{c})|(\\\\''c)', 'c', line)
-    line = re.sub('(.\.\-.\.)|(.\-.\.)|(I\,)', '', line)
-    #print(line)
+    sorts the bibliography of a single document of 'bibsort_many()' and
+    returns the dictionary describing the result. In a worker process, the
+    citation commands of the calling process ('cite_commands') are
+    registered again, and its settings of the backups ('backup_settings',
+    i.e. BACKUP_DIRNAME, BACKUP_KEEP, BACKUP_MAXSIZE and BACKUP_COMPRESS)
+    are set again.
+    """
+
+    global _re_cite, BACKUP_DIRNAME, BACKUP_KEEP, BACKUP_MAXSIZE, BACKUP_COMPRESS
+
+    if cite_commands is not None and cite_commands != _cite_commands:
+        _cite_commands[:] = cite_commands
+        _re_cite = _build_cite_pattern()
+
+    if backup_settings is not None:
+        BACKUP_DIRNAME, BACKUP_KEEP, BACKUP_MAXSIZE, BACKUP_COMPRESS = backup_settings
+
+    dirname, filename_in = os.path.split(os.path.abspath(filename))
+    result = {'filename': filename, 'status': 'failed', 'error': None, 
+              'nbibitems': 0, 'changed': None, 'diff': [], 'elapsed': 0.0, 'log': '', 
+              'stats': new_stats()}
+
+    # as on the command line, a missing root file is not parsed at all
+    if not os.path.isfile(os.path.join(dirname, filename_in)):
+        result['error'] = f"cannot open file '{filename}'"
+        return result
+
+    t0 = time.perf_counter()
+    messages = []
+
     try:
-        arg = re.search('(bibitem(\[.*\])?{[^{]*}\s*)(sc)?(it)?({\s*)?'+\
-        '([A-Z][a-z]\.\s)*([A-Z]\.\s)*([A-Z]\.[A-Z]\.\s)*{*\s*', line).group(0)
-        #arg = re.sub('\\Bi', 'Bi', arg)
-        author, flag_err = line[len(arg)+1:], 0
-    except:
-        author, flag_err = "", 1
-    return author, flag_err
-    """
-    return abc
-    
-    
+        # the messages are only kept in the log (the worker prints nothing)
+        with _collecting(messages, lambda level, message: None):
+            sorted_ = sort_bibliography(filename_in, None, dirname, flag_sort, flag_stripcomments, 
+                                        flag_backup, flag_verbose, flag_mmap, flag_cache, 1, 
+                                        result['stats'], collation=collation, 
+                                        flag_skip_unchanged=flag_skip_unchanged, 
+                                        flag_dry_run=flag_dry_run)
+        if sorted_.ok:
+            result['status'] = 'ok'
+        else:
+            result['error'] = sorted_.error
+        result['nbibitems'] = len(sorted_.bibitems)
+        result['changed'] = sorted_.changed
+        result['diff'] = sorted_.diff()
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
 
-def make_new_bib(cites, bibitems, flag_sort, flag_verbose=True):
-    
-    if flag_sort in ['c', 'call']:
-        flag_sort_by_call = True
-        str_sort = 'by call'
-    else:
-        flag_sort_by_call = False
-        str_sort = 'alphabetic'
-    flag_sort_alphabetic = not flag_sort_by_call
-    
+    result['elapsed'] = time.perf_counter() - t0
+    result['log'] = ''.join(message+'\n' for level, message in messages)
 
-    print(SS+f"processing sorted bibliography ({str_sort} order)")
+    return result
 
-    thebibliography = ''
-    i = 0
 
-    if flag_sort_by_call:
-        
-        bb_keys = list(bibitems.keys())
-        i_nokey, i_nocite = 0, 0
 
-        for key in cites:
+def expand_batch_files(items, dirname=None):
+    """
+    returns the list of the root files given by 'items' (without
+    duplicates), where each item is either the name of a file, a glob
+    pattern (e.g. 'issue12/*/main.tex') or the name of a manifest file
+    preceded by '@', listing one root file (or pattern) per line (empty
+    lines and lines beginning with '#' are skipped). The names are relative
+    to 'dirname', and the names in a manifest to the directory of the
+    manifest.
+    """
 
-            if key in bb_keys:
-                thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
-                i += 1
-                bibitems[key][2] = i
-            else:
-                if flag_verbose:
-                    print(SS+f"WARNING: citation '{key}' does not appear in the bibliography")
-                i_nokey += 1
+    if dirname is None:
+        dirname = ''
 
+    filenames = []
 
-        if i < len(bibitems):
+    for item in items:
 
-            sorted_bibitems = sorted(list(bibitems.items()), key=operator.itemgetter(1))
-            for item in sorted_bibitems:
-                if item[1][2] < 1:
-                    if flag_verbose:
-                        print(SS+f"WARNING: bibitem '{item[0]}' (position #{item[1][0]}) is not cited in the text (moved at the bottom)")
-                    key = item[0]
-                    thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
-                    i_nocite += 1
-                    i += 1
+        if item.startswith('@'):
+            filename_manifest = os.path.join(dirname, item[1:])
+            with open(filename_manifest, 'r') as f:
+                lines = [l.strip() for l in f]
+            filenames.extend(expand_batch_files(
+                [l for l in lines if l and not l.startswith('#')], 
+                os.path.dirname(filename_manifest)))
+            continue
 
-        if i_nokey > 0:
-            print(S+f"found {i_nokey} citations without a bibitem entry")
+        pattern = os.path.join(dirname, item)
+        if glob.has_magic(pattern):
+            filenames.extend(sorted(glob.glob(pattern)))
+        else:
+            filenames.append(pattern)
 
-        if i_nocite > 0:
-            print(S+f"found {i_nocite} bibliography entries without citations (moved at the bottom)")
+    return remove_duplicates_preserve_order(filenames)
 
-        print(S+f"{i} bibliography entries have been processed")
 
-    elif flag_sort_alphabetic:
-        
-        for key in bibitems:
-            bibitems[key][3] = create_abc(bibitems[key][1])
-            
-        sorted_bibitems = sorted(list(bibitems.items()), key=lambda abc: abc[1][3])
-        
-        for key, value in sorted_bibitems:
-            thebibliography = thebibliography + bibitems[key][1] #+ '\n\n'
-            i += 1
-            bibitems[key][2] = i
-            
-            print(f"{i}: {bibitems[key][3]}")
 
-    return thebibliography
+def bibsort_many(filenames, flag_sort='call', flag_stripcomments=True, flag_backup=True, 
+                 flag_verbose=True, flag_mmap=False, flag_cache=False, nworkers=None, 
+                 collation=None, flag_skip_unchanged=True, flag_dry_run=False):
+    """
+    sorts in place the bibliographies of many independent documents using a
+    pool of 'nworkers' processes [default: number of CPUs], and returns a
+    list (in the same order of 'filenames') of dictionaries as follows:
+      'filename': name of the root file
+      'status': 'ok' or 'failed'
+      'error': description of the error (None if no error occurred)
+      'nbibitems': number of entries of the bibliography
+      'changed': whether the order of the entries has changed (None if
+                 failed)
+      'diff': keys moved, see 'SortResult.diff()'
+      'elapsed': time spent on the document (in seconds)
+      'log': messages sent while sorting the document
+      'stats': statistics of the stages (see 'new_stats()')
 
+    Arguments:
+       filenames
+           list of the paths of the root files (each document is parsed in
+           the directory of its root file), see also 'expand_batch_files()'
+       flag_skip_unchanged, flag_dry_run
+           as for 'sort_bibliography()'
+    """
 
+    # the worker processes do not inherit the citation commands registered
+    # here, nor the settings of the backups (e.g. when they are spawned),
+    # which are then sent with each job
+    backup_settings = (BACKUP_DIRNAME, BACKUP_KEEP, BACKUP_MAXSIZE, BACKUP_COMPRESS)
+    jobs = [(filename, flag_sort, flag_stripcomments, flag_backup, flag_verbose, 
+             flag_mmap, flag_cache, collation, flag_skip_unchanged, flag_dry_run, 
+             list(_cite_commands), backup_settings) 
+            for filename in filenames]
 
+    if nworkers == 1 or len(jobs) <= 1:
+        return [_bibsort_batch_job(*job) for job in jobs]
 
+    with concurrent.futures.ProcessPoolExecutor(nworkers) as executor:
+        futures = [executor.submit(_bibsort_batch_job, *job) for job in jobs]
+        return [future.result() for future in futures]
 
-def make_backup_file(filename_in):
 
-    if filename_in[-4:] == '.tex':
-        filename_in_noext = filename_in[:-4]
-    else:
-        filename_in_noext = filename_in
 
+def print_batch_summary(results, elapsed=None):
+    """
+    prints one line for each document processed by 'bibsort_many()', and
+    the total number of documents sorted and failed.
+    """
 
-    fin = open(filename_in_noext+'.tex', 'r')
-    content = fin.read()
-    fin.close()
+    for result in results:
+        if result['status'] == 'ok':
+            str_changed = 'order changed' if result['changed'] else 'order unchanged'
+            print(SS+f"[ok] '{result['filename']}' ({result['nbibitems']} entries, {str_changed}, {result['elapsed']:.2f} s)")
+        else:
+            print(SS+f"[failed] '{result['filename']}' ({result['error']})")
 
-    count = 0
-    filename_backup = filename_in_noext + '.backup.' + str(count) + '.tex'
+    nfailed = sum(1 for result in results if result['status'] != 'ok')
+    str_elapsed = f" in {elapsed:.2f} s" if elapsed is not None else ""
 
-    while os.path.isfile(filename_backup):
-        count += 1
-        filename_backup = filename_in_noext + '.backup.' + str(count) + '.tex'
+    print(S+f"sorted {len(results)-nfailed} of {len(results)} documents ({nfailed} failed){str_elapsed}")
 
-    fout = open(filename_backup, 'w')
-    fout.write(content)
-    fout.close()
 
-    print(S+f"backup of input file containing bibliography: '{filename_backup}'")
 
 
+def write_stats_json(stats, filename, fout=None):
+    """
+    writes 'stats' (as returned by 'new_stats()', or any dictionary of them)
+    to 'filename' in JSON format ('-' for 'fout', by default the standard
+    output).
+    """
 
+    if filename == '-':
+        fout = fout or sys.stdout
+        json.dump(stats, fout, indent=2)
+        fout.write('\n')
+    else:
+        with open(filename, 'w') as f:
+            json.dump(stats, f, indent=2)
 
-def write_new_file(filename_bib_in, filename_bib_out, new_bib):
 
-    f = open(filename_bib_in, 'r')
-    text = f.read()
 
-    s_beg, s_end = r'\begin{thebibliography}', r'\end{thebibliography}'
-    i0 = text.find(s_beg)
-    i0 = text.find(r'}', i0+len(s_beg)) + 1
-    i1 = text.find(s_end)
 
-    #new_bib = os.linesep.join([s for s in new_bib.splitlines() if s])
+# default port of the daemon (see 'serve_http()') and maximum number of
+# documents whose parsed files are kept in memory between the jobs
+DAEMON_PORT = 8765
+DAEMON_MAXDOCS = 64
 
-    text_new = text[:i0] + '\n' + new_bib + '\n'+ text[i1:]
 
-    f = open(filename_bib_out, 'w')
-    f.write(text_new)
-    f.close()
+def new_job_cache():
+    """
+    returns the in-memory cache shared by the jobs of 'run_job()', holding
+    the parsed files of the last DAEMON_MAXDOCS documents sorted.
+    """
 
-    print(S+f"output file: '{filename_bib_out}'")
+    return {'docs': {}, 'lock': threading.Lock()}
 
-    return text_new
 
 
+def _job_flag(job, name, default):
+    # boolean option of a job, given either as a boolean or as 'y'/'n'
+    value = job.get(name, default)
+    if isinstance(value, str):
+        return value in ['y', 'yes']
+    return bool(value)
 
 
-def bibsort(filename_in, filename_out=None, dirname=None, \
-            flag_sort='call', flag_stripcomments=True, flag_backup=True, 
-            flag_verbose=True):
 
-    print("*"*65)
-    print(f"* PySorTeX {version} -  Copyright (C) 2015, Andrea Mentrelli       *")
-    print("* This program comes with ABSOLUTELY NO WARRANTY.               *")
-    print("* This is free software, and you are welcome to redistribute it *")
-    print("* under certain conditions. For details, run the program with   *")
-    print("* the flag -w (i.e. python pysort.py -w)                        *")
-    print("*"*65)
-    
-    if dirname is None:
-        dirname = os.getcwd()
+def run_job(job, cache=None):
+    """
+    runs a sort job and returns the dictionary describing the result, as
+    sent back by the daemon. Nothing is printed.
+
+    Arguments:
+       job
+           dictionary with the following items (as the options of the
+           command line, all optional but the first one):
+             'inputfile': root file of the document
+             'directory': directory of the document [default: working
+                          directory of the daemon]
+             'outputfile', 'sort', 'collation': as the command line options
+             'comments', 'backup', 'warnings', 'mmap', 'cache', 'check':
+                         booleans (or 'y'/'n') as the command line options
+             'files': dictionary mapping the names of the files to their
+                      contents, for a document held in memory (see
+                      'sort_files()'), where nothing is read or written
+             'id': any value, sent back as it is
+       cache [optional]
+           dictionary returned by 'new_job_cache()', where the parsed files
+           are kept, so that only the files changed since the previous job
+           on the same document are parsed again
+
+    As on the command line, the file containing the bibliography is not
+    rewritten (nor backed up) if the order of its entries is unchanged, and
+    nothing is written if 'check' is true.
+
+    The returned dictionary holds 'id', 'ok', 'error', 'written', 'changed'
+    (whether the order of the entries is changed), 'diff' (keys moved, see
+    'SortResult.diff()'), 'filename_bib', 'filename_out', 'missing',
+    'uncited', 'warnings', 'messages' (list of strings), 'elapsed'
+    (seconds) and, for a document held in memory, 'text' (new content of
+    the file of the bibliography).
+    """
 
-    text, nfiles, filename_bib = recursive_parser(filename_in, dirname, flag_stripcomments)
+    t0 = time.perf_counter()
+    response = {'id': job.get('id') if isinstance(job, dict) else None, 'ok': False, 'error': None}
 
-    if filename_out is None:
-        filename_out = filename_bib
-        flag_backup = True
+    try:
+        if not isinstance(job, dict):
+            raise ValueError("the job is not a JSON object")
+        filename_in = job['inputfile']
+        flag_sort = SORT_MODES.get(job.get('sort'), 'call')
+        flag_stripcomments = not _job_flag(job, 'comments', False)
+        flag_verbose = _job_flag(job, 'warnings', True)
+
+        # the messages are only kept in the result
+        if job.get('files') is not None:
+            result = sort_files(job['files'], filename_in, flag_sort, flag_stripcomments, 
+                                flag_verbose, callback=lambda level, message: None, 
+                                collation=job.get('collation'))
+        else:
+            dirname = os.path.abspath(job.get('directory') or os.getcwd())
+            docid = (dirname, filename_in, flag_stripcomments)
+            records = None
+            if cache is not None:
+                with cache['lock']:
+                    records = cache['docs'].pop(docid, {})
+            result = _bibsort(filename_in, job.get('outputfile'), dirname, flag_sort, 
+                              flag_stripcomments, _job_flag(job, 'backup', True), flag_verbose, 
+                              _job_flag(job, 'mmap', False), _job_flag(job, 'cache', False), 1, 
+                              records, True, callback=lambda level, message: None, 
+                              collation=job.get('collation'), 
+                              flag_dry_run=_job_flag(job, 'check', False))
+            if cache is not None:
+                with cache['lock']:
+                    cache['docs'][docid] = records
+                    while len(cache['docs']) > DAEMON_MAXDOCS:
+                        del cache['docs'][next(iter(cache['docs']))]
+
+        filename_bib, filename_out = result.filename_bib, result.filename_out
+        if job.get('files') is None and filename_bib is not None:
+            # the paths of the daemon are relative to its own working directory
+            filename_bib, filename_out = os.path.abspath(filename_bib), os.path.abspath(filename_out)
+
+        response.update({'ok': result.ok, 'error': result.error, 'written': result.written, 
+                         'changed': result.changed, 'diff': result.diff(), 
+                         'filename_bib': filename_bib, 'filename_out': filename_out,
+                         'missing': result.missing, 'uncited': result.uncited, 
+                         'warnings': result.warnings, 
+                         'messages': [message for level, message in result.messages]})
+        if job.get('files') is not None:
+            response['text'] = result.text
+
+    except Exception as e:
+        response['error'] = f"{type(e).__name__}: {e}"
+
+    response['elapsed'] = time.perf_counter() - t0
+
+    return response
+
+
+
+def serve_stdin(fin=None, fout=None):
+    """
+    runs the jobs read from 'fin' [default: standard input], one JSON
+    object per line (see 'run_job()'), writing each result to 'fout'
+    [default: standard output] as a JSON object on a single line, until
+    the end of the input.
+    """
+
+    fin = fin or sys.stdin
+    fout = fout or sys.stdout
+    cache = new_job_cache()
 
-    if flag_backup:
-        make_backup_file(filename_bib)
+    for line in fin:
 
-    cites = parse_cites(text)
+        if not line.strip():
+            continue
 
-    bibitems = parse_bibitems(text)
+        try:
+            job = json.loads(line)
+        except ValueError as e:
+            response = {'id': None, 'ok': False, 'error': f"invalid job: {e}"}
+        else:
+            response = run_job(job, cache)
+
+        fout.write(json.dumps(response)+'\n')
+        fout.flush()
 
-    new_bib = make_new_bib(cites, bibitems, flag_sort, flag_verbose)
 
-    if new_bib is not None:
-        tt = write_new_file(filename_bib, filename_out, new_bib)
-        print(S+"done!")
-    else:
-        tt = None
-        print(S+"...execution failed :/")
 
-    return tt, bibitems
+def serve_http(port=DAEMON_PORT, host='127.0.0.1'):
+    """
+    runs the jobs sent to 'http://host:port/' by POST requests, whose body
+    is a job in JSON format (see 'run_job()'), answering with the result in
+    JSON format, until interrupted by Ctrl-C. The jobs are run concurrently
+    in separate threads. A GET request answers with the version, so that it
+    can be used to check that the daemon is up.
+
+    Note that anybody who can connect to the daemon can rewrite the files
+    readable by it: by default it only listens on the local host. Since the
+    web pages opened in a browser can connect to it, the jobs are accepted
+    only with content type 'application/json' (which the browsers do not
+    send to another site without asking it first) and with a 'Host' header
+    naming the local host or 'host' (against DNS rebinding).
+    """
+
+    import http.server
+
+    cache = new_job_cache()
+    hosts = {'localhost', '127.0.0.1', '[::1]', host.lower()}
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+
+        def _send(self, code, response):
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _host_ok(self):
+            # the 'Host' header, without the port, names this host
+            name = (self.headers.get('Host') or '').strip().lower()
+            if not name.startswith('['):
+                name = name.rpartition(':')[0] or name
+            elif ']:' in name:
+                name = name[:name.index(']:')+1]
+            if name in hosts:
+                return True
+            self._send(403, {'id': None, 'ok': False, 'error': f"host not allowed: '{name}'"})
+            return False
+
+        def do_GET(self):
+            if self._host_ok():
+                self._send(200, {'version': version})
+
+        def do_POST(self):
+            if not self._host_ok():
+                return
+            content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+            if content_type != 'application/json':
+                self._send(415, {'id': None, 'ok': False, 
+                                 'error': "the content type of the job must be 'application/json'"})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                job = json.loads(self.rfile.read(length))
+            except ValueError as e:
+                self._send(400, {'id': None, 'ok': False, 'error': f"invalid job: {e}"})
+                return
+            self._send(200, run_job(job, cache))
+
+        def log_message(self, format, *args):
+            _info(SS+(format % args))
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    _info(S+f"serving on http://{host}:{server.server_address[1]}/ (press Ctrl-C to stop)")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        _info(S+"stopped serving")
+    finally:
+        server.server_close()
 
 
 
@@ -538,10 +3487,26 @@ if __name__ == "__main__":
     parser.add_argument('-i','--inputfile', help="input file (containing the bibliography)", required=False)
     parser.add_argument('-d','--directory', help="directory of input file(s)", required=False)
     parser.add_argument('-o','--outputfile', help="output file", required=False)
-    parser.add_argument('-s','--sort', help="type of sorting: 'c': by call [default], 'a': alphabetic", required=False)
+    parser.add_argument('-s','--sort', help="type of sorting: 'c': by call [default], 'a': alphabetic, 'ay': by author and year, 'ya': by year and author, 'ac': by first author and number of authors", required=False)
+    parser.add_argument('-l','--collation', choices=sorted(_collations), help="collation of the alphabetic sort (and of the sort by authors), keeping the accents (e.g. 'de', 'sv') [default: accents ignored]", required=False)
     parser.add_argument('-c','--comments', help="parsing of comments: 'y': parse comments, 'n': don't parse comments [default]", required=False)
     parser.add_argument('-b','--backup', help="backup of inputfile: 'y': make a backup [default], 'y': don't make a backup", required=False)
     parser.add_argument('-w','--warnings', help="display warnings: 'y': display [default], 'n': don't display", required=False)
+    parser.add_argument('-m','--mmap', help="memory-mapped output of large files: 'y': use mmap, 'n': don't use mmap [default]", required=False)
+    parser.add_argument('-k','--cache', help="cache of parsed files and of the strings for the alphabetic sort: 'y': keep the cache in directory '.pysortex-cache', 'n': don't use the cache [default]", required=False)
+    parser.add_argument('-j','--jobs', type=int, default=None, help="number of threads used to read the files [default 1]; with --batch, number of documents sorted in parallel [default: number of CPUs]", required=False)
+    parser.add_argument('--batch', nargs='+', metavar='FILE', help="sort in place many documents: root files, glob patterns or manifest files preceded by '@' (one root file per line)", required=False)
+    parser.add_argument('--stats-json', metavar='FILE', help="write the time spent by each stage to FILE in JSON format ('-' for standard output, the messages then going to standard error)", required=False)
+    parser.add_argument('--watch', action='store_true', help="keep watching the files and sort again the bibliography when they change", required=False)
+    parser.add_argument('--serve', metavar='ADDRESS', help=f"run as a daemon accepting sort jobs in JSON format: '-' for one job per line on standard input, else a port (or host:port) where jobs are received by HTTP [default host 127.0.0.1, default port {DAEMON_PORT}]", required=False)
+    parser.add_argument('--cite-commands', metavar='NAMES', help="extra citation commands, separated by commas (e.g. 'citeA,shortcite'), besides \\cite, \\nocite and those of natbib and biblatex", required=False)
+    parser.add_argument('--check', action='store_true', help="sort without writing anything, and exit with status 1 if the order of the bibliography would change, 0 if unchanged (2 if failed)", required=False)
+    parser.add_argument('--diff', action='store_true', help="print the keys moved by the sort (unified diff)", required=False)
+    parser.add_argument('--backup-keep', type=int, metavar='N', help="number of backups kept for each file [default: all]", required=False)
+    parser.add_argument('--backup-maxsize', type=int, metavar='BYTES', help="maximum size of the backups kept in a directory (the oldest ones are dropped) [default: no limit]", required=False)
+    parser.add_argument('--backup-compress', action='store_true', help="compress the backups (gzip)", required=False)
+    parser.add_argument('--list-backups', metavar='FILE', help=f"list the backups of FILE (kept in directory '{BACKUP_DIRNAME}')", required=False)
+    parser.add_argument('--restore', metavar='FILE[:N]', help="restore the backup number N of FILE [default: the last one]", required=False)
     parser.add_argument('-L', action='store_true', help="show licence information", required=False)
 
     args = vars(parser.parse_args())
@@ -561,10 +3526,7 @@ if __name__ == "__main__":
     else:
         filename_out = args['outputfile']
 
-    if args['sort'] in ['a', 'alphabetic']:
-        flag_sort = 'alphabetic'
-    else:
-        flag_sort = 'call'
+    flag_sort = SORT_MODES.get(args['sort'], 'call')
 
     if args['comments'] in ['y', 'yes']:
         flag_stripcomments = False
@@ -576,6 +3538,26 @@ if __name__ == "__main__":
     else:
         flag_backup = True
 
+    if args['cite_commands'] is not None:
+        add_cite_commands(name.strip() for name in args['cite_commands'].split(',') if name.strip())
+
+    if args['backup_keep'] is not None:
+        BACKUP_KEEP = args['backup_keep']
+    if args['backup_maxsize'] is not None:
+        BACKUP_MAXSIZE = args['backup_maxsize']
+    if args['backup_compress']:
+        BACKUP_COMPRESS = True
+
+    if args['mmap'] in ['y', 'yes']:
+        flag_mmap = True
+    else:
+        flag_mmap = False
+
+    if args['cache'] in ['y', 'yes']:
+        flag_cache = True
+    else:
+        flag_cache = False
+
     if args['L']:
         filename_in = None
         try:
@@ -590,11 +3572,83 @@ if __name__ == "__main__":
     else:
         flag_verbose = True
 
-    if filename_in is not None:
+    # with '--stats-json -' the standard output is left to the JSON document,
+    # and all the rest is printed to the standard error
+    stdout = sys.stdout
+    if args['stats_json'] == '-' and args['serve'] is None:
+        sys.stdout = sys.stderr
+
+    # the messages of the library functions are printed as they are
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    if args['serve'] is not None and not args['L']:
+        if args['serve'] == '-':
+            serve_stdin()
+        else:
+            host, _, port = args['serve'].rpartition(':')
+            print_banner()
+            serve_http(int(port or DAEMON_PORT), host or '127.0.0.1')
+
+    elif args['batch'] is not None and not args['L']:
+        print_banner()
+        t0 = time.perf_counter()
+        results = bibsort_many(expand_batch_files(args['batch'], args['directory']), flag_sort, 
+                               flag_stripcomments, flag_backup, flag_verbose, flag_mmap, 
+                               flag_cache, args['jobs'], args['collation'], True, args['check'])
+        if args['diff']:
+            for result in results:
+                for line in result['diff']:
+                    print(line)
+        print_batch_summary(results, time.perf_counter()-t0)
+        if args['stats_json'] is not None:
+            write_stats_json({result['filename']: result['stats'] for result in results}, 
+                             args['stats_json'], stdout)
+        if any(result['status'] != 'ok' for result in results):
+            sys.exit(2 if args['check'] else 1)
+        if args['check'] and any(result['changed'] for result in results):
+            sys.exit(1)
+
+    elif args['list_backups'] is not None and not args['L']:
+        for entry in list_backups(os.path.join(dirname, args['list_backups'])):
+            print(f"#{entry['n']:<6}{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['time']))}"
+                  f"{entry['size']:>12} bytes")
+
+    elif args['restore'] is not None and not args['L']:
+        filename, _, n = args['restore'].rpartition(':')
+        if not filename or not n.isdigit():
+            filename, n = args['restore'], None
+        try:
+            restore_backup(os.path.join(dirname, filename), None if n is None else int(n))
+        except (OSError, ValueError) as e:
+            print(S+f"{e}")
+            print(S+"execution failed :(")
+            sys.exit(1)
+
+    elif filename_in is not None:
         fname = os.path.join(dirname, filename_in)
         if os.path.isfile(fname):
-            bibsort(filename_in, filename_out, dirname, flag_sort, \
-                flag_stripcomments, flag_backup, flag_verbose)
+            print_banner()
+            if args['watch']:
+                watch(filename_in, filename_out, dirname, flag_sort, \
+                    flag_stripcomments, flag_backup, flag_verbose, flag_mmap, flag_cache, 
+                    args['jobs'] or 1, collation=args['collation'])
+            else:
+                stats = new_stats() if args['stats_json'] is not None else None
+                # the files are touched only if the order of the bibliography changes
+                result = sort_bibliography(filename_in, filename_out, dirname, flag_sort, \
+                    flag_stripcomments, flag_backup, flag_verbose, flag_mmap, flag_cache, 
+                    args['jobs'] or 1, stats, collation=args['collation'], 
+                    flag_skip_unchanged=True, flag_dry_run=args['check'])
+                if args['diff']:
+                    for line in result.diff():
+                        print(line)
+                if stats is not None:
+                    write_stats_json(stats, args['stats_json'], stdout)
+                if args['check']:
+                    sys.exit(2 if not result.ok else 1 if result.changed else 0)
         else:
             print(S+f"file '{fname}' not found")
             print(S+"execution failed :(")
\ No newline at end of file
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+#    PySorTeX client
+#        Thin client sending a sort job to a PySorTeX daemon (started by
+#        'python pysortex3.py --serve PORT'), so that each run pays neither
+#        the start-up of the program nor the compilation of its patterns.
+#
+#    Copyright (C) 2015, Andrea Mentrelli <andrea.mentrelli@unibo.it>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+#!/usr/bin/env python
+
+import sys
+import os
+import json
+import urllib.request
+
+# same as DAEMON_PORT of pysortex3.py
+DAEMON_PORT = 8765
+
+
+def send_job(job, server=f"127.0.0.1:{DAEMON_PORT}", timeout=None):
+    """
+    sends 'job' (see 'run_job()' of pysortex3.py) to the daemon listening
+    at 'server' (host:port) and returns its response.
+    """
+
+    request = urllib.request.Request(f"http://{server}/", data=json.dumps(job).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as f:
+        return json.loads(f.read())
+
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-i','--inputfile', help="input file (containing the bibliography)", required=True)
+    parser.add_argument('-d','--directory', help="directory of input file(s)", required=False)
+    parser.add_argument('-o','--outputfile', help="output file", required=False)
+    parser.add_argument('-s','--sort', help="type of sorting: 'c': by call [default], 'a': alphabetic, 'ay': by author and year, 'ya': by year and author, 'ac': by first author and number of authors", required=False)
+    parser.add_argument('-l','--collation', help="collation of the alphabetic sort (and of the sort by authors), keeping the accents (e.g. 'de', 'sv') [default: accents ignored]", required=False)
+    parser.add_argument('-c','--comments', help="parsing of comments: 'y': parse comments, 'n': don't parse comments [default]", required=False)
+    parser.add_argument('-b','--backup', help="backup of inputfile: 'y': make a backup [default], 'y': don't make a backup", required=False)
+    parser.add_argument('-w','--warnings', help="display warnings: 'y': display [default], 'n': don't display", required=False)
+    parser.add_argument('-k','--cache', help="cache of parsed files and of the strings for the alphabetic sort: 'y': keep the cache in directory '.pysortex-cache', 'n': don't use the cache [default]", required=False)
+    parser.add_argument('--check', action='store_true', help="sort without writing anything, and exit with status 1 if the order of the bibliography would change, 0 if unchanged (2 if failed)", required=False)
+    parser.add_argument('--diff', action='store_true', help="print the keys moved by the sort (unified diff)", required=False)
+    parser.add_argument('--server', default=f"127.0.0.1:{DAEMON_PORT}", help=f"host:port of the daemon [default 127.0.0.1:{DAEMON_PORT}]", required=False)
+
+    args = vars(parser.parse_args())
+
+    # the paths are sent as seen from here, since the daemon may run elsewhere
+    job = {'inputfile': args['inputfile'],
+           'directory': os.path.abspath(args['directory'] or os.getcwd())}
+    if args['outputfile'] is not None:
+        job['outputfile'] = os.path.abspath(args['outputfile'])
+    for name in ('sort', 'collation', 'comments', 'backup', 'warnings', 'cache'):
+        if args[name] is not None:
+            job[name] = args[name]
+    if args['check']:
+        job['check'] = True
+
+    try:
+        response = send_job(job, args['server'])
+    except OSError as e:
+        print(f"...cannot reach the daemon at '{args['server']}': {e}")
+        sys.exit(2)
+
+    for message in response.get('messages', []):
+        print(message)
+    if args['diff']:
+        for line in response.get('diff', []):
+            print(line)
+    if not response['ok']:
+        print(f"...execution failed: {response['error']}")
+        sys.exit(2 if args['check'] else 1)
+    if args['check'] and response.get('changed'):
+        sys.exit(1)
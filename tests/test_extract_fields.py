@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+#    Regression cases of 'extract_fields()' (authors, year and title of the
+#    entries, for the sort by fields), one for each style of the authors.
+#
+#    Usage:
+#        $ python -m unittest discover tests
+#        $ python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pysortex3 import extract_fields, BibFields
+
+
+# (entry, authors, year, title)
+CASES = [
+    # initials before the names
+    (r"\bibitem{a} F.~Smith and J.~Doe, \emph{Title}, Journal 43, 2010.",
+     ('Smith', 'Doe'), '2010', 'Title'),
+    (r"\bibitem{a} A. B. Author, C. Other, and D. Third, A title, Journal 1, 1999.",
+     ('Author', 'Other', 'Third'), '1999', 'A title'),
+    (r"\bibitem{a} J. Nu\~nez and K. Bj{\o}rk, Title, J. 2001.",
+     ('Nu\\~nez', 'Bj\\o rk'), '2001', 'Title'),
+    (r"\bibitem{a} John A. Smith and Jane Doe, Title, 1999.",
+     ('Smith', 'Doe'), '1999', 'Title'),
+    (r"\bibitem{a} J. Smith (Eds.), Book title, Publisher, 2005.",
+     ('Smith',), '2005', 'Book title'),
+    # initials after the names
+    (r"\bibitem{a} Smith, F., Doe, J. (2010). A title. Journal.",
+     ('Smith', 'Doe'), '2010', 'A title'),
+    (r"\bibitem{a} Smith, F. et al. Title here. 2003.",
+     ('Smith',), '2003', 'Title here'),
+    # authors ended by ':' (e.g. Springer)
+    (r"\bibitem{a} Smith, F.: Title here. J. 2001.",
+     ('Smith',), '2001', 'Title here'),
+    (r"\bibitem{a} Zorn, M., Abel, N.: Title one. J. 2001.",
+     ('Zorn', 'Abel'), '2001', 'Title one'),
+    # full names, ended by the end of the sentence
+    (r"\bibitem{a} John Smith and Jane Doe. Some title. 1999.",
+     ('Smith', 'Doe'), '1999', 'Some title'),
+    (r"\bibitem{a} John Smith and Jane Doe, ``Sorting, quickly,'' in Proc. ACM, 1999.",
+     ('Smith', 'Doe'), '1999', 'Sorting, quickly'),
+    # Vancouver
+    (r"\bibitem{a} Smith F, Doe J. Title. J Med. 2001;43:1-10.",
+     ('Smith', 'Doe'), '2001', 'Title'),
+    (r"\bibitem{a} Smith F, Doe J, et al. Title. 2001.",
+     ('Smith', 'Doe'), '2001', 'Title'),
+    # no authors
+    (r"\bibitem{a} Some report without authors, 2004.",
+     (), '2004', 'Some report without authors'),
+]
+
+
+class TestExtractFields(unittest.TestCase):
+
+    def test_styles(self):
+        for entry, authors, year, title in CASES:
+            with self.subTest(entry=entry):
+                self.assertEqual(extract_fields(entry), BibFields(authors, year, title))
+
+
+
+if __name__ == '__main__':
+    unittest.main()